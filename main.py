@@ -11,10 +11,1352 @@ from tkinterdnd2 import DND_FILES, TkinterDnD
 import base64
 import time
 import shutil  # add at top
+import collections
+import io
+import tarfile
+import queue
+import hashlib
+import array
+import zlib
+import ctypes
+import ctypes.util
+import select
+import struct
+import sys
+import bisect
+import heapq
+import re
+from screen_share import FrameDecoder, ScreenGrabSource, ScreenSharer
 
 # --- Application Version ---
 VERSION = "4.0.1"  # Defined VERSION here
 
+# --- Outbound Send Scheduling ---
+
+# Traffic classes, highest priority first
+PRIORITY_CONTROL, PRIORITY_CHAT, PRIORITY_WHITEBOARD, PRIORITY_SCREEN, PRIORITY_BULK = range(
+    5)
+PRIORITY_COUNT = 5
+
+COMMAND_PRIORITIES = {
+    "CHAT_MSG": PRIORITY_CHAT, "EDIT_MSG": PRIORITY_CHAT,
+    "DELETE_MSG": PRIORITY_CHAT, "CLEAR_CHAT": PRIORITY_CHAT,
+    "DRAW": PRIORITY_WHITEBOARD, "CLEAR": PRIORITY_WHITEBOARD,
+    "MOUSE_MOVE": PRIORITY_WHITEBOARD, "MOUSE_LEAVE": PRIORITY_WHITEBOARD,
+    "FILE_START_TRANSFER": PRIORITY_BULK, "FILE_CHUNK": PRIORITY_BULK,
+    "FILE_END": PRIORITY_BULK,
+    "VAULT_CHUNK": PRIORITY_BULK, "SCREEN_PART": PRIORITY_SCREEN,
+}
+# Commands where only the newest queued copy matters
+COALESCED_COMMANDS = {"MOUSE_MOVE"}
+# Commands followed by a binary payload whose length is the last header field
+BINARY_FRAMES = {"FILE_CHUNK", "FILE_PREVIEW", "VAULT_NODE",
+                 "VAULT_MANIFEST", "VAULT_CHUNK", "SCREEN_PART", "OUTBOX_BATCH"}
+
+CHUNK_SIZE = 64 * 1024
+BULK_QUEUE_LIMIT = 1024 * 1024  # bytes queued before bulk producers block
+BULK_SOCKET_BUFFER = 4 * 1024 * 1024
+MAX_CHUNK_RETRIES = 3
+
+
+def tune_socket(sock, bulk=False):
+    """Disable Nagle for interactive sockets, enlarge buffers for bulk ones."""
+    try:
+        if bulk:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF,
+                            BULK_SOCKET_BUFFER)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                            BULK_SOCKET_BUFFER)
+        else:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError as e:
+        print(f"Error tuning socket: {e}")
+
+
+# Screen bytes allowed to wait in the kernel ahead of interactive traffic
+SCREEN_INFLIGHT = 2 * CHUNK_SIZE
+SIOCOUTQ = 0x5411  # Linux ioctl: bytes in a socket's send queue not yet acked
+
+
+def unsent_bytes(sock):
+    """Bytes the kernel still holds for sock, or None where that can't be read."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import fcntl
+        return struct.unpack("i", fcntl.ioctl(sock.fileno(), SIOCOUTQ, b"\0" * 4))[0]
+    except (ImportError, OSError, ValueError):
+        return None
+
+
+class SendScheduler:
+    """Single writer thread for one socket, fed by per-class priority queues."""
+
+    def __init__(self, sock, on_error, bulk_limit=BULK_QUEUE_LIMIT):
+        self.sock = sock
+        self.on_error = on_error
+        self.bulk_limit = bulk_limit
+        self._queues = [collections.deque() for _ in range(PRIORITY_COUNT)]
+        self._bulk_bytes = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def send(self, data, priority=PRIORITY_CONTROL, key=None, on_sent=None):
+        """Queue bytes for sending. Bulk producers block while the bulk queue is full.
+
+        on_sent, if given, is called from the writer thread once the bytes
+        have been handed to the socket.
+        """
+        with self._cond:
+            if priority == PRIORITY_BULK:
+                while self._bulk_bytes >= self.bulk_limit and not self._closed:
+                    self._cond.wait()
+            if self._closed:
+                return False
+            pending = self._queues[priority]
+            if key is not None:
+                for i, (queued_key, _, _) in enumerate(pending):
+                    if queued_key == key:
+                        pending[i] = (key, data, on_sent)
+                        return True
+            pending.append((key, data, on_sent))
+            if priority == PRIORITY_BULK:
+                self._bulk_bytes += len(data)
+            self._cond.notify_all()
+        return True
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for pending in self._queues:
+                pending.clear()
+            self._bulk_bytes = 0
+            self._cond.notify_all()
+
+    def _next_batch(self):
+        """Pop the highest priority item, plus any interactive items behind it.
+
+        Returns (bytes, callbacks to run once they are sent), or None once closed.
+        """
+        with self._cond:
+            while not self._closed and not any(self._queues):
+                self._cond.wait()
+            if self._closed:
+                return None
+            for priority, pending in enumerate(self._queues):
+                if pending:
+                    break
+            _, data, on_sent = pending.popleft()
+            callbacks = [on_sent] if on_sent else []
+            # Wake bulk producers
+            self._cond.notify_all()
+            if priority == PRIORITY_BULK:
+                self._bulk_bytes -= len(data)
+                return data, callbacks
+            # Coalesce small interactive messages into one syscall
+            batch = [data]
+            size = len(data)
+            for pending in self._queues[:PRIORITY_BULK]:
+                while pending and size < CHUNK_SIZE:
+                    _, data, on_sent = pending.popleft()
+                    batch.append(data)
+                    size += len(data)
+                    if on_sent:
+                        callbacks.append(on_sent)
+            return b"".join(batch), callbacks
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            data, callbacks = batch
+            try:
+                self.sock.sendall(data)
+            except Exception as e:
+                print(f"Error sending data: {e}")
+                self.close()
+                self.on_error()
+                return
+            for callback in callbacks:
+                callback()
+
+# --- File Transfer Management ---
+
+PREVIEW_SIZE = (96, 96)
+
+
+def make_preview(path):
+    """Return (JPEG thumbnail bytes, original (width, height)) for an image, else None."""
+    try:
+        with Image.open(path) as img:
+            size = img.size
+            # Let the JPEG decoder downscale while decoding
+            img.draft("RGB", (PREVIEW_SIZE[0] * 2, PREVIEW_SIZE[1] * 2))
+            thumb = img.convert("RGB")
+        thumb.thumbnail(PREVIEW_SIZE)
+        buf = io.BytesIO()
+        thumb.save(buf, format="JPEG", quality=85)
+        return buf.getvalue(), size
+    except Exception:
+        return None
+
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class TokenBucket:
+    """Bandwidth limiter; a rate of 0 bytes per second means unlimited."""
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.tokens = 0
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        """Take amount tokens, sleeping off any debt. Bursts up to one second."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens +
+                              (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= amount
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+class Transfer:
+    """Progress and pause/cancel state for one file moving in either direction."""
+
+    SPEED_WINDOW = 5.0
+
+    def __init__(self, file_id, filename, total, direction):
+        self.file_id = file_id
+        self.filename = filename
+        self.total = total
+        self.direction = direction  # "up", "down" or "export"
+        self.done = 0
+        self.verify_seconds = 0.0  # time spent hashing chunks
+        self.state = "queued"  # queued, active, paused, done, cancelled, failed
+        self.finished_at = None
+        self._samples = collections.deque()
+        self._resume = threading.Event()
+        self._resume.set()
+
+    @property
+    def finished(self):
+        return self.state in ("done", "cancelled", "failed")
+
+    def advance(self, amount):
+        self.done += amount
+        now = time.monotonic()
+        self._samples.append((now, self.done))
+        while now - self._samples[0][0] > self.SPEED_WINDOW:
+            self._samples.popleft()
+
+    def throughput(self):
+        """Bytes per second over the recent sample window."""
+        if len(self._samples) < 2:
+            return 0
+        (t0, d0), (t1, d1) = self._samples[0], self._samples[-1]
+        return (d1 - d0) / (t1 - t0) if t1 > t0 else 0
+
+    def eta(self):
+        speed = self.throughput()
+        return (self.total - self.done) / speed if speed else None
+
+    def wait_if_paused(self):
+        self._resume.wait()
+
+    def pause(self):
+        if self.state == "active":
+            self.state = "paused"
+            self._resume.clear()
+
+    def resume(self):
+        if self.state == "paused":
+            self.state = "active"
+            self._resume.set()
+
+    def cancel(self):
+        if not self.finished:
+            self.state = "cancelled"
+        self._resume.set()
+
+
+class TransferManager:
+    """Starts transfers under a per-direction concurrency limit and bandwidth caps."""
+
+    FINISHED_LINGER = 5.0
+    # Local exports are listed alongside but are not slot-limited or
+    # affected by the peer disconnecting
+    PEER_DIRECTIONS = ("up", "down")
+
+    def __init__(self, max_concurrent=2, upload_limit=0, download_limit=0):
+        self.max_concurrent = max_concurrent
+        self.buckets = {"up": TokenBucket(upload_limit),
+                        "down": TokenBucket(download_limit)}
+        self.transfers = collections.OrderedDict()
+        self._starters = {}
+        self._lock = threading.RLock()
+
+    def configure(self, max_concurrent, upload_limit, download_limit):
+        self.max_concurrent = max(1, max_concurrent)
+        self.buckets["up"].rate = max(0, upload_limit)
+        self.buckets["down"].rate = max(0, download_limit)
+        self._pump()
+
+    def add(self, transfer):
+        with self._lock:
+            self.transfers[transfer.file_id] = transfer
+        return transfer
+
+    def get(self, file_id):
+        return self.transfers.get(file_id)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.transfers.values())
+
+    def start(self, file_id, starter):
+        """Run starter once a slot is free for this transfer's direction."""
+        with self._lock:
+            if file_id not in self.transfers:
+                return
+            self._starters[file_id] = starter
+        self._pump()
+
+    def finish(self, file_id, state="done"):
+        with self._lock:
+            transfer = self.transfers.get(file_id)
+            self._starters.pop(file_id, None)
+            if transfer:
+                if not transfer.finished:
+                    transfer.state = state
+                transfer.finished_at = time.monotonic()
+        self._pump()
+
+    def fail_all(self):
+        with self._lock:
+            self._starters.clear()
+            for transfer in self.transfers.values():
+                if not transfer.finished and transfer.direction in self.PEER_DIRECTIONS:
+                    transfer.state = "failed"
+                    transfer.finished_at = time.monotonic()
+                    transfer._resume.set()
+
+    def prune(self):
+        """Forget transfers that finished a few seconds ago."""
+        now = time.monotonic()
+        with self._lock:
+            for file_id, transfer in list(self.transfers.items()):
+                if transfer.finished and now - transfer.finished_at > self.FINISHED_LINGER:
+                    del self.transfers[file_id]
+
+    def throttle(self, direction, amount):
+        self.buckets[direction].consume(amount)
+
+    def _pump(self):
+        to_run = []
+        with self._lock:
+            for direction in self.PEER_DIRECTIONS:
+                active = sum(1 for t in self.transfers.values()
+                             if t.direction == direction and t.state in ("active", "paused"))
+                for file_id, transfer in self.transfers.items():
+                    if active >= self.max_concurrent:
+                        break
+                    if transfer.direction == direction and transfer.state == "queued" and file_id in self._starters:
+                        transfer.state = "active"
+                        to_run.append(self._starters.pop(file_id))
+                        active += 1
+        for starter in to_run:
+            starter()
+
+# --- Folder Bundles ---
+
+TAR_BLOCK = tarfile.BLOCKSIZE
+
+
+def build_bundle(root):
+    """List (tar header, source path, size) for every entry under root."""
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        rel_dir = os.path.relpath(dirpath, root)
+        if rel_dir != ".":
+            info = tarfile.TarInfo(rel_dir.replace(os.sep, "/"))
+            info.type, info.mode = tarfile.DIRTYPE, 0o755
+            info.mtime = int(os.path.getmtime(dirpath))
+            entries.append((info.tobuf(tarfile.PAX_FORMAT), None, 0))
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            info = tarfile.TarInfo(os.path.relpath(
+                path, root).replace(os.sep, "/"))
+            info.size, info.mode, info.mtime = stat.st_size, 0o644, int(
+                stat.st_mtime)
+            entries.append((info.tobuf(tarfile.PAX_FORMAT), path, stat.st_size))
+    return entries
+
+
+def bundle_size(entries):
+    """Exact byte length of the tar stream iter_bundle produces."""
+    total = 2 * TAR_BLOCK
+    for header, _, size in entries:
+        total += len(header) + -(-size // TAR_BLOCK) * TAR_BLOCK
+    return total
+
+
+def iter_bundle(entries, chunk_size=CHUNK_SIZE):
+    """Generate a tar stream on the fly, packing small files into full chunks."""
+    buf = bytearray()
+    for header, path, size in entries:
+        buf += header
+        if path:
+            remaining = size
+            try:
+                with open(path, 'rb') as f:
+                    while remaining > 0:
+                        data = f.read(min(chunk_size, remaining))
+                        if not data:
+                            break
+                        buf += data
+                        remaining -= len(data)
+                        while len(buf) >= chunk_size:
+                            yield bytes(buf[:chunk_size])
+                            del buf[:chunk_size]
+            except OSError as e:
+                print(f"Error reading {path} for bundle: {e}")
+            # Keep the framing intact if the file shrank or vanished
+            buf += bytes(remaining)
+            buf += bytes(-size % TAR_BLOCK)
+        while len(buf) >= chunk_size:
+            yield bytes(buf[:chunk_size])
+            del buf[:chunk_size]
+    buf += bytes(2 * TAR_BLOCK)
+    while buf:
+        yield bytes(buf[:chunk_size])
+        del buf[:chunk_size]
+
+
+class BundleExtractor:
+    """File-like sink that extracts a streamed tar bundle as bytes arrive."""
+
+    def __init__(self, target):
+        self.target = os.path.realpath(target)
+        os.makedirs(self.target, exist_ok=True)
+        self.error = None
+        self._chunks = queue.Queue(maxsize=64)
+        self._pending = b""
+        self._eof = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._extract, daemon=True)
+        self._thread.start()
+
+    def write(self, data):
+        self._chunks.put(data)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._chunks.put(None)
+        self._thread.join()
+
+    def read(self, size=-1):
+        """Called by tarfile on the extraction thread."""
+        while not self._eof and (size < 0 or len(self._pending) < size):
+            data = self._chunks.get()
+            if data is None:
+                self._eof = True
+            else:
+                self._pending += data
+        if size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def _extract(self):
+        try:
+            with tarfile.open(fileobj=self, mode="r|") as tar:
+                for member in tar:
+                    dest = os.path.realpath(
+                        os.path.join(self.target, member.name))
+                    if not dest.startswith(self.target + os.sep):
+                        print(f"Skipping unsafe bundle entry: {member.name}")
+                        continue
+                    if member.isdir():
+                        os.makedirs(dest, exist_ok=True)
+                    elif member.isfile():
+                        os.makedirs(os.path.dirname(dest), exist_ok=True)
+                        with tar.extractfile(member) as src, open(dest, 'wb') as dst:
+                            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                        os.utime(dest, (member.mtime, member.mtime))
+        except Exception as e:
+            print(f"Error extracting bundle: {e}")
+            self.error = e
+        # Drain so the writer never blocks on a full queue
+        while not self._eof:
+            self.read(CHUNK_SIZE)
+
+# --- Local Export ---
+
+EXPORT_CHUNK_SIZE = 1024 * 1024
+FICLONE = 0x40049409  # Linux ioctl that shares extents between two files
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def _reflink(src, dst):
+    """Clone src into dst without copying data, where the filesystem allows it."""
+    try:
+        import fcntl
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except (ImportError, OSError):
+        return False
+
+
+def export_file(src_path, dst_path, transfer):
+    """Copy one file for an export, cheapest method first.
+
+    Tries a reflink, then os.copy_file_range (an in-kernel copy), then a
+    plain chunked copy. Data goes to a .part file that only replaces
+    dst_path once complete, and the transfer is checked for pause and
+    cancellation between chunks.
+    """
+    part_path = dst_path + ".part"
+    try:
+        with open(src_path, 'rb', buffering=0) as src, open(part_path, 'wb', buffering=0) as dst:
+            size = os.fstat(src.fileno()).st_size
+            if size and _reflink(src, dst):
+                transfer.advance(size)
+            else:
+                use_copy_range = hasattr(os, "copy_file_range")
+                buf = memoryview(bytearray(EXPORT_CHUNK_SIZE))
+                while True:
+                    transfer.wait_if_paused()
+                    if transfer.state == "cancelled":
+                        raise ExportCancelled()
+                    if use_copy_range:
+                        try:
+                            n = os.copy_file_range(
+                                src.fileno(), dst.fileno(), EXPORT_CHUNK_SIZE)
+                        except OSError:
+                            # Unsupported here (e.g. across filesystems on
+                            # older kernels); both offsets are unchanged
+                            use_copy_range = False
+                            continue
+                    else:
+                        n = src.readinto(buf)
+                        if n:
+                            dst.write(buf[:n])
+                    if not n:
+                        break
+                    transfer.advance(n)
+        shutil.copymode(src_path, part_path)
+        os.replace(part_path, dst_path)
+    except BaseException:
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+        raise
+
+
+def export_path(src_path, dst_path, transfer):
+    """Export a file or a whole folder to dst_path."""
+    if not os.path.isdir(src_path):
+        export_file(src_path, dst_path, transfer)
+        return
+    for root, dirs, files in os.walk(src_path):
+        target = os.path.join(dst_path, os.path.relpath(root, src_path))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            export_file(os.path.join(root, name),
+                        os.path.join(target, name), transfer)
+
+
+def path_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(path) for name in files)
+
+
+# --- Downloads Watching ---
+
+IN_ATTRIB, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO = 0x4, 0x8, 0x40, 0x80
+IN_CREATE, IN_DELETE, IN_Q_OVERFLOW, IN_IGNORED = 0x100, 0x200, 0x4000, 0x8000
+IN_WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+def scan_folder(folder):
+    """Snapshot a folder's entries as name -> [inode, size, mtime_ns]."""
+    snapshot = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            # Incoming files are written as .part and renamed when verified
+            if entry.name.endswith(".part"):
+                continue
+            try:
+                st = entry.stat()
+                snapshot[entry.name] = [entry.inode(), st.st_size,
+                                        st.st_mtime_ns]
+            except OSError:
+                pass
+    return snapshot
+
+
+def diff_snapshots(old, new, names):
+    """Compare the given names between two snapshots.
+
+    Returns (added, removed, moved, changed); moved pairs are removed names
+    whose inode, size and mtime reappeared under an added name (matching on
+    all three guards against a freed inode being reused by a new file).
+    """
+    added, removed, changed = [], [], []
+    for name in names:
+        before, after = old.get(name), new.get(name)
+        if before == after:
+            continue
+        if before is None:
+            added.append(name)
+        elif after is None:
+            removed.append(name)
+        else:
+            changed.append(name)
+    by_identity = {tuple(new[name]): name for name in added if new[name][0]}
+    moved = []
+    for name in list(removed):
+        target = by_identity.pop(tuple(old[name]), None)
+        if target:
+            moved.append((name, target))
+            removed.remove(name)
+            added.remove(target)
+    return added, removed, moved, changed
+
+
+def _inotify_open(folder):
+    """An inotify descriptor watching folder, or None where inotify is unavailable."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(folder), IN_WATCH_MASK) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+def _read_inotify(fd):
+    """Read pending events; returns (names touched, OR of event masks)."""
+    data = os.read(fd, 64 * 1024)
+    names, flags, offset = set(), 0, 0
+    while offset < len(data):
+        _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+        offset += INOTIFY_EVENT.size
+        name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+        offset += length
+        flags |= mask
+        if name and not name.endswith(".part"):
+            names.add(name)
+    return names, flags
+
+
+class DownloadsWatcher:
+    """Keeps a persisted snapshot of a folder in step with what is on disk.
+
+    reconcile() compares the saved snapshot against a fresh scan, so
+    startup only has to act on what changed while the app was closed.
+    While running, inotify events (or a periodic rescan where inotify is
+    unavailable) update just the touched names, and the differences are
+    passed to on_change(added, removed, moved, changed).
+    """
+
+    POLL_INTERVAL = 2.0
+    SETTLE_TIME = 0.3
+
+    def __init__(self, folder, snapshot_file, on_change):
+        self.folder = folder
+        self.snapshot_file = snapshot_file
+        self.on_change = on_change
+        self.snapshot = {}
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self.load()
+
+    def load(self):
+        try:
+            if os.path.exists(self.snapshot_file):
+                with open(self.snapshot_file, 'r') as f:
+                    self.snapshot = json.load(f)
+        except Exception as e:
+            print(f"Error loading downloads snapshot: {e}")
+            self.snapshot = {}
+
+    def save(self):
+        with self.lock:
+            try:
+                with open(self.snapshot_file, 'w') as f:
+                    json.dump(self.snapshot, f)
+            except Exception as e:
+                print(f"Error saving downloads snapshot: {e}")
+
+    def reconcile(self):
+        """Rescan the folder, returning its differences from the snapshot."""
+        current = scan_folder(self.folder)
+        with self.lock:
+            old, self.snapshot = self.snapshot, current
+        return diff_snapshots(old, current, set(old) | set(current))
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        fd = _inotify_open(self.folder)
+        if fd is not None:
+            try:
+                self._watch(fd)
+            finally:
+                os.close(fd)
+        while not self._stop.wait(self.POLL_INTERVAL):
+            self._report(self.reconcile())
+
+    def _watch(self, fd):
+        while not self._stop.is_set():
+            if not select.select([fd], [], [], 1.0)[0]:
+                continue
+            # Let a burst of events settle into one batch
+            names, flags = set(), 0
+            while select.select([fd], [], [], self.SETTLE_TIME)[0]:
+                batch, batch_flags = _read_inotify(fd)
+                names |= batch
+                flags |= batch_flags
+            if flags & IN_IGNORED:
+                return  # folder itself went away; fall back to polling
+            self._report(self.reconcile() if flags & IN_Q_OVERFLOW
+                         else self._update(names))
+
+    def _update(self, names):
+        with self.lock:
+            old = {name: self.snapshot[name]
+                   for name in names if name in self.snapshot}
+            for name in names:
+                try:
+                    st = os.stat(os.path.join(self.folder, name))
+                    self.snapshot[name] = [st.st_ino, st.st_size,
+                                           st.st_mtime_ns]
+                except OSError:
+                    self.snapshot.pop(name, None)
+            new = {name: self.snapshot[name]
+                   for name in names if name in self.snapshot}
+        return diff_snapshots(old, new, names)
+
+    def _report(self, changes):
+        if any(changes):
+            try:
+                self.on_change(*changes)
+            except Exception as e:
+                print(f"Error handling downloads change: {e}")
+
+
+# --- Vault Sync ---
+
+VAULT_CHUNK_SIZE = 256 * 1024
+VAULT_TMP_DIR = ".vortex_tmp"
+
+
+def chunk_digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def tombstone_digest(deleted_ns):
+    return chunk_digest(f"deleted\0{deleted_ns}".encode())
+
+
+def tree_digest(*parts):
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part.encode('utf-8'))
+    return h.hexdigest()
+
+
+class VaultIndex:
+    """Merkle tree over a vault folder.
+
+    Chunk hashes roll up into file hashes and file hashes into folder
+    hashes, so two peers can find their differences by comparing roots and
+    descending only into subtrees whose hashes differ. Only folders on the
+    path of a changed file are rehashed. Deleted files stay in the tree as
+    tombstones (kind "x") carrying the deletion time, so a deletion can win
+    over an older copy on the peer instead of being pulled back.
+    """
+
+    def __init__(self, root, index_file):
+        self.root = os.path.realpath(root)
+        self.index_file = index_file
+        self.files = {}  # rel path -> {"size", "mtime_ns", "chunks", "hash"}
+        self.deleted = {}  # rel path -> deletion time in ns
+        self.tree = {"": {}}  # rel dir -> {name: [kind, hash]}
+        self.dir_hashes = {}
+        self.lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._dirty = set()
+        self._chunk_map = None
+        os.makedirs(self.root, exist_ok=True)
+        shutil.rmtree(os.path.join(self.root, VAULT_TMP_DIR),
+                      ignore_errors=True)
+        self.load()
+
+    def load(self):
+        try:
+            if os.path.exists(self.index_file):
+                with open(self.index_file, 'r') as f:
+                    data = json.load(f)
+                self.files, self.deleted = data["files"], data["deleted"]
+        except Exception as e:
+            print(f"Error loading vault index: {e}")
+            self.files, self.deleted = {}, {}
+        for rel, entry in self.files.items():
+            self._link(rel, "f", entry["hash"])
+        for rel, deleted_ns in self.deleted.items():
+            self._link(rel, "x", tombstone_digest(deleted_ns))
+
+    def save(self):
+        with self.lock:
+            try:
+                with open(self.index_file, 'w') as f:
+                    json.dump({"files": self.files,
+                               "deleted": self.deleted}, f)
+            except Exception as e:
+                print(f"Error saving vault index: {e}")
+
+    def abs_path(self, rel):
+        """Resolve a peer-supplied relative path, refusing escapes."""
+        path = os.path.realpath(os.path.join(self.root, *rel.split("/")))
+        if not path.startswith(self.root + os.sep) or VAULT_TMP_DIR in rel.split("/"):
+            raise ValueError(f"Unsafe vault path: {rel}")
+        return path
+
+    @property
+    def root_hash(self):
+        with self.lock:
+            self._rehash()
+            return self.dir_hashes.get("", tree_digest())
+
+    def _mark(self, rel_dir):
+        while True:
+            self._dirty.add(rel_dir)
+            if not rel_dir:
+                return
+            rel_dir = rel_dir.rpartition("/")[0]
+
+    def _link(self, rel, kind, digest):
+        parent, _, name = rel.rpartition("/")
+        self.tree.setdefault(parent, {})[name] = [kind, digest]
+        self._mark(parent)
+        # Make sure every ancestor folder is reachable from the root
+        while parent:
+            grandparent, _, dirname = parent.rpartition("/")
+            self.tree.setdefault(grandparent, {}).setdefault(
+                dirname, ["d", ""])
+            parent = grandparent
+
+    def _rehash(self):
+        # Deepest folders first so parents see their children's new hashes
+        for rel_dir in sorted(self._dirty, key=lambda d: d.count("/") + bool(d), reverse=True):
+            children = self.tree.get(rel_dir)
+            if children is None:
+                continue
+            digest = tree_digest(*(f"{name}\0{kind}\0{child_hash}\n"
+                                   for name, (kind, child_hash) in sorted(children.items())))
+            self.dir_hashes[rel_dir] = digest
+            if rel_dir:
+                parent, _, name = rel_dir.rpartition("/")
+                self.tree[parent][name] = ["d", digest]
+        self._dirty.clear()
+
+    def record_file(self, rel, size, mtime_ns, chunks):
+        """Store a file's chunk hashes and update its ancestors."""
+        with self.lock:
+            digest = tree_digest(str(size), *chunks)
+            self.files[rel] = {"size": size, "mtime_ns": mtime_ns,
+                               "chunks": chunks, "hash": digest}
+            self.deleted.pop(rel, None)
+            self._link(rel, "f", digest)
+            self._chunk_map = None
+
+    def remove_file(self, rel, deleted_ns=None):
+        """Replace a file with a tombstone, deleting it from disk if still there."""
+        with self.lock:
+            try:
+                os.remove(self.abs_path(rel))
+            except FileNotFoundError:
+                pass
+            self._tombstone(rel, deleted_ns)
+
+    def _tombstone(self, rel, deleted_ns=None):
+        with self.lock:
+            if deleted_ns is None:
+                deleted_ns = time.time_ns()
+            self.files.pop(rel, None)
+            self.deleted[rel] = deleted_ns
+            self._link(rel, "x", tombstone_digest(deleted_ns))
+            self._chunk_map = None
+
+    def stamp(self, rel):
+        """A file's mtime, or a tombstone's deletion time, in ns; None if unknown."""
+        with self.lock:
+            entry = self.files.get(rel)
+            return entry["mtime_ns"] if entry else self.deleted.get(rel)
+
+    def update_file(self, rel):
+        """Rehash rel if its size or mtime changed. Returns True on change.
+
+        The file is read without holding the lock, so peers' vault commands
+        are not held up while a large file is hashed.
+        """
+        path = self.abs_path(rel)
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.files.get(rel)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return False
+        chunks = []
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(VAULT_CHUNK_SIZE)
+                if not data:
+                    break
+                chunks.append(chunk_digest(data))
+        self.record_file(rel, stat.st_size, stat.st_mtime_ns, chunks)
+        return True
+
+    def refresh(self):
+        """Reconcile the index with the vault on disk. Returns changed file count."""
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        # Pulls keep recording files while the walk runs; only entries that
+        # existed before it and were not re-recorded since can be missing
+        with self.lock:
+            before = dict(self.files)
+        seen, changed = set(), 0
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root and VAULT_TMP_DIR in dirnames:
+                dirnames.remove(VAULT_TMP_DIR)
+            rel_dir = os.path.relpath(dirpath, self.root).replace(os.sep, "/")
+            for name in filenames:
+                rel = name if rel_dir == "." else f"{rel_dir}/{name}"
+                seen.add(rel)
+                try:
+                    changed += self.update_file(rel)
+                except (OSError, ValueError) as e:
+                    print(f"Error indexing vault file {rel}: {e}")
+        with self.lock:
+            for rel in set(before) - seen:
+                if self.files.get(rel) is before[rel] and not os.path.exists(
+                        self.abs_path(rel)):
+                    self._tombstone(rel)
+                    changed += 1
+        if changed:
+            self.save()
+        return changed
+
+    def lookup(self, rel):
+        """Return [kind, hash] for a path, or None."""
+        with self.lock:
+            self._rehash()
+            parent, _, name = rel.rpartition("/")
+            return self.tree.get(parent, {}).get(name)
+
+    def node(self, rel_dir):
+        """Children of a folder as [name, kind, hash, mtime_ns] rows."""
+        with self.lock:
+            self._rehash()
+            children = []
+            for name, (kind, digest) in sorted(self.tree.get(rel_dir, {}).items()):
+                rel = f"{rel_dir}/{name}" if rel_dir else name
+                children.append([name, kind, digest, self.stamp(rel) or 0])
+            return {"path": rel_dir, "children": children}
+
+    def manifest(self, rel):
+        with self.lock:
+            entry = self.files.get(rel)
+            return dict(entry, path=rel) if entry else None
+
+    def read_chunk(self, digest):
+        """Return the bytes of a chunk this vault already holds, or None."""
+        with self.lock:
+            if self._chunk_map is None:
+                self._chunk_map = {}
+                for rel, entry in self.files.items():
+                    for index, chunk in enumerate(entry["chunks"]):
+                        self._chunk_map.setdefault(chunk, (rel, index))
+            location = self._chunk_map.get(digest)
+        if not location:
+            return None
+        try:
+            with open(self.abs_path(location[0]), 'rb') as f:
+                f.seek(location[1] * VAULT_CHUNK_SIZE)
+                data = f.read(VAULT_CHUNK_SIZE)
+        except (OSError, ValueError):
+            return None
+        return data if chunk_digest(data) == digest else None
+
+# --- Chat Search ---
+
+CHAT_INDEX_COMMANDS = ("CHAT_MSG", "EDIT_MSG", "DELETE_MSG", "CLEAR_CHAT")
+# Commands recorded in the chat history log
+HISTORY_COMMANDS = CHAT_INDEX_COMMANDS + \
+    ("ADD_TO_GALLERY", "DELETE_FILE_COMMAND")
+MIN_PREFIX_LENGTH = 3
+MAX_PREFIX_TERMS = 64  # completions a partial last word may expand to
+# Unsnapshotted log bytes tolerated before save() rewrites the snapshot
+SNAPSHOT_THRESHOLD = 1024 * 1024
+
+
+def tokenize(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def _pack(values):
+    return base64.b64encode(values.tobytes()).decode('ascii')
+
+
+def _unpack(typecode, text):
+    values = array.array(typecode)
+    values.frombytes(base64.b64decode(text))
+    return values
+
+
+def _contains(seqs, seq):
+    i = bisect.bisect_left(seqs, seq)
+    return i < len(seqs) and seqs[i] == seq
+
+
+class ChatIndex:
+    """Inverted index over chat message text.
+
+    Mirrors the chat log: it is fed the same commands that are appended to
+    the log, together with each line's byte offset. Messages are stored as
+    log offsets rather than text; an edit or delete reads the old line back
+    to find the terms to drop. Postings are ascending lists of message
+    sequence numbers, so a search walks them from the newest end and stops
+    once it has enough results.
+
+    The log doubles as the index journal: the snapshot records how far into
+    the log it covers, startup indexes only the tail after that, and save()
+    skips rewriting the snapshot until the tail has grown large.
+
+    Writers must hold lock while appending to the log and applying, so the
+    recorded offsets match the lines; search() takes it too.
+    """
+
+    def __init__(self, index_file, log_file):
+        self.index_file = index_file
+        self.log_file = log_file
+        self.offset = 0  # bytes of the chat log already indexed
+        self.saved_offset = 0  # bytes of the chat log covered by the snapshot
+        self.seq = 0
+        self.messages = {}  # msg id -> [seq, log offset of its current text]
+        self.ids = {}  # seq -> msg id
+        self.postings = {}  # term -> ascending list of seqs
+        self.terms = []
+        self.lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        try:
+            if os.path.exists(self.index_file):
+                with open(self.index_file, 'r') as f:
+                    data = json.load(f)
+                offsets = _unpack("Q", data["offsets"])
+                counts = _unpack("I", data["counts"])
+                seqs = _unpack("I", data["postings"])
+                for seq, msg_id in enumerate(data["ids"], 1):
+                    if msg_id:
+                        self.ids[seq] = msg_id
+                        self.messages[msg_id] = [seq, offsets[seq - 1]]
+                start = 0
+                for term, count in zip(data["terms"], counts):
+                    self.postings[term] = seqs[start:start + count].tolist()
+                    start += count
+                self.terms = list(data["terms"])
+                self.offset = self.saved_offset = data["offset"]
+                self.seq = data["seq"]
+        except Exception as e:
+            print(f"Error loading chat index: {e}")
+            self.clear()
+
+    def save(self, force=False):
+        with self.lock:
+            self._save(force)
+
+    def _save(self, force):
+        if not force and self.offset - self.saved_offset < SNAPSHOT_THRESHOLD:
+            return
+        try:
+            # Sequence numbers and offsets are stored as packed arrays, which
+            # load far faster than the equivalent JSON lists
+            ids, offsets = [None] * self.seq, array.array("Q", bytes(8 * self.seq))
+            for msg_id, (seq, offset) in self.messages.items():
+                ids[seq - 1], offsets[seq - 1] = msg_id, offset
+            seqs = array.array("I")
+            for term in self.terms:
+                seqs.extend(self.postings[term])
+            with open(self.index_file, 'w') as f:
+                json.dump({"offset": self.offset, "seq": self.seq, "ids": ids,
+                           "offsets": _pack(offsets), "terms": self.terms,
+                           "counts": _pack(array.array("I", map(len, (self.postings[t] for t in self.terms)))),
+                           "postings": _pack(seqs)}, f)
+            self.saved_offset = self.offset
+        except Exception as e:
+            print(f"Error saving chat index: {e}")
+
+    def clear(self):
+        self.offset = self.seq = 0
+        self.messages, self.ids, self.postings, self.terms = {}, {}, {}, []
+
+    def catch_up(self):
+        """Index chat log lines written since the snapshot was taken."""
+        with self.lock:
+            self._catch_up()
+
+    def _catch_up(self):
+        if not os.path.exists(self.log_file):
+            self.clear()
+            return
+        if os.path.getsize(self.log_file) < self.offset:
+            self.clear()  # log was cleared or replaced behind our back
+        # newline='' keeps line lengths true to the bytes on disk, so offsets
+        # can be counted without the slow text-mode tell()
+        with open(self.log_file, 'r', newline='') as f:
+            f.seek(self.offset)
+            position = self.offset
+            for line in f:
+                self.apply(line.strip(), position)
+                position += len(line.encode(f.encoding))
+        self.offset = position
+
+    def apply(self, command_str, offset):
+        """Index a logged command; offset is where its line starts in the log."""
+        with self.lock:
+            self._apply(command_str, offset)
+
+    def _apply(self, command_str, offset):
+        cmd = command_str.split(":", 1)[0]
+        if cmd == "CHAT_MSG":
+            _, msg_id, _, text = command_str.split(":", 3)
+            self._remove(msg_id)
+            self.seq += 1
+            self._add(msg_id, self.seq, offset, text)
+        elif cmd == "EDIT_MSG":
+            _, msg_id, _, text = command_str.split(":", 3)
+            if msg_id in self.messages:
+                seq = self.messages[msg_id][0]
+                self._remove(msg_id)
+                self._add(msg_id, seq, offset, text)
+        elif cmd == "DELETE_MSG":
+            self._remove(command_str.split(":", 1)[1])
+        elif cmd == "CLEAR_CHAT":
+            self.clear()
+            # The log was truncated, so an older snapshot no longer lines up
+            self._save(True)
+
+    def _text_at(self, offset):
+        with open(self.log_file, 'r') as f:
+            f.seek(offset)
+            return f.readline().strip().split(":", 3)[3]
+
+    def _add(self, msg_id, seq, offset, text):
+        self.messages[msg_id] = [seq, offset]
+        self.ids[seq] = msg_id
+        for term in set(tokenize(text)):
+            seqs = self.postings.get(term)
+            if seqs is None:
+                seqs = self.postings[term] = []
+                bisect.insort(self.terms, term)
+            if not seqs or seqs[-1] < seq:
+                seqs.append(seq)
+            else:
+                bisect.insort(seqs, seq)  # an edit of an older message
+
+    def _remove(self, msg_id):
+        entry = self.messages.pop(msg_id, None)
+        if not entry:
+            return
+        seq, offset = entry
+        del self.ids[seq]
+        try:
+            text = self._text_at(offset)
+        except (OSError, IndexError) as e:
+            print(f"Error reading chat log for index: {e}")
+            return
+        for term in set(tokenize(text)):
+            seqs = self.postings.get(term)
+            if seqs and _contains(seqs, seq):
+                del seqs[bisect.bisect_left(seqs, seq)]
+                if not seqs:
+                    del self.postings[term]
+                    del self.terms[bisect.bisect_left(self.terms, term)]
+
+    def _completions(self, prefix):
+        i = bisect.bisect_left(self.terms, prefix)
+        matches = []
+        while i < len(self.terms) and self.terms[i].startswith(prefix) and len(matches) < MAX_PREFIX_TERMS:
+            matches.append(self.postings[self.terms[i]])
+            i += 1
+        return matches
+
+    def search(self, query, limit=50):
+        """Message ids containing every query word, newest first."""
+        with self.lock:
+            return self._search(query, limit)
+
+    def _search(self, query, limit):
+        words = tokenize(query)
+        if not words:
+            return []
+        exact = [self.postings.get(word, []) for word in words[:-1]]
+        last = words[-1]
+        # The last word may still be being typed, so it also matches as a
+        # prefix once it is long enough
+        alternatives = self._completions(last) if len(
+            last) >= MIN_PREFIX_LENGTH else [self.postings.get(last, [])]
+        if not all(exact) or not any(alternatives):
+            return []
+        if exact:
+            exact.sort(key=len)
+            candidates, others = reversed(exact[0]), exact[1:]
+        else:
+            # Newest-first merge of the completions' postings
+            candidates = heapq.merge(
+                *(reversed(seqs) for seqs in alternatives), reverse=True)
+            alternatives, others = None, []
+        results, previous = [], None
+        for seq in candidates:
+            if seq == previous:
+                continue
+            previous = seq
+            if all(_contains(seqs, seq) for seqs in others) and (
+                    alternatives is None or any(_contains(seqs, seq) for seqs in alternatives)):
+                results.append(self.ids[seq])
+                if len(results) == limit:
+                    break
+        return results
+
+
+# --- Offline Outbox ---
+
+# Peer-visible edits worth keeping while disconnected; cursor moves are not
+OUTBOX_COMMANDS = {"CHAT_MSG", "EDIT_MSG", "DELETE_MSG", "CLEAR_CHAT",
+                   "ADD_TO_GALLERY", "DELETE_FILE_COMMAND", "DRAW", "CLEAR"}
+# Queued commands that make earlier queued commands of these kinds pointless
+OUTBOX_SUPERSEDES = {"CLEAR_CHAT": {"CHAT_MSG", "EDIT_MSG", "DELETE_MSG"},
+                     "CLEAR": {"DRAW"}}
+
+
+class Outbox:
+    """Persistent, numbered queue of commands made while the peer is unreachable.
+
+    outbox.jsonl starts with a record of this outbox's id and the last
+    sequence number the peer acknowledged, so numbering carries on after
+    acknowledged entries are compacted away and the peer can skip anything
+    it has already applied.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.id = str(uuid.uuid4())
+        self.acked = 0
+        self.entries = []  # [seq, command]
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    for line in f:
+                        record = json.loads(line)
+                        if "id" in record:
+                            self.id, self.acked = record["id"], record["acked"]
+                        elif record["seq"] > self.acked:
+                            self.entries.append([record["seq"], record["cmd"]])
+        except Exception as e:
+            # A line torn by a crash ends the log; keep what came before it
+            print(f"Error loading outbox: {e}")
+        self._rewrite()
+
+    def _rewrite(self):
+        try:
+            with open(self.path + ".tmp", 'w') as f:
+                f.write(json.dumps({"id": self.id, "acked": self.acked}) + "\n")
+                for seq, command in self.entries:
+                    f.write(json.dumps({"seq": seq, "cmd": command}) + "\n")
+            os.replace(self.path + ".tmp", self.path)
+        except Exception as e:
+            print(f"Error saving outbox: {e}")
+
+    def add(self, command):
+        with self.lock:
+            seq = self.entries[-1][0] + 1 if self.entries else self.acked + 1
+            self.entries.append([seq, command])
+            try:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps({"seq": seq, "cmd": command}) + "\n")
+            except Exception as e:
+                print(f"Error saving outbox: {e}")
+
+    def batch(self):
+        """Compressed payload of every unacknowledged command, or None if empty."""
+        with self.lock:
+            if not self.entries:
+                return None
+            events, superseded = [], set()
+            for seq, command in reversed(self.entries):
+                cmd = command.split(":", 1)[0]
+                if cmd in superseded:
+                    continue
+                superseded |= OUTBOX_SUPERSEDES.get(cmd, set())
+                events.append([seq, command])
+            events.reverse()
+            return zlib.compress(json.dumps(
+                {"id": self.id, "last": self.entries[-1][0], "events": events}).encode('utf-8'))
+
+    def ack(self, seq):
+        with self.lock:
+            self.acked = max(self.acked, seq)
+            self.entries = [e for e in self.entries if e[0] > self.acked]
+            self._rewrite()
+
+
 # --- Custom Tooltip Class ---
 
 
@@ -53,7 +1395,7 @@ class SettingsDialog(ctk.CTkToplevel):
         super().__init__(master)
         self.app = app_instance
         self.title("Settings")
-        self.geometry("400x300")
+        self.geometry("400x460")
         self.transient(master)
         self.grab_set()
         self.attributes('-alpha', 1.0)
@@ -70,12 +1412,42 @@ class SettingsDialog(ctk.CTkToplevel):
         ctk.CTkLabel(info_frame, text=f"Peer Name: {self.app.peer_name or 'Not Connected'}", font=ctk.CTkFont(
             size=14)).pack(anchor="w", padx=10)
 
+        # Transfer limits
+        transfer_frame = ctk.CTkFrame(self)
+        transfer_frame.pack(pady=10, padx=20, fill="x")
+        transfer_frame.grid_columnconfigure(1, weight=1)
+        ctk.CTkLabel(transfer_frame, text="Concurrent transfers:", font=ctk.CTkFont(
+            size=14)).grid(row=0, column=0, sticky="w", padx=10, pady=2)
+        self.concurrent_menu = ctk.CTkOptionMenu(
+            transfer_frame, values=["1", "2", "3", "4", "6", "8"], width=80)
+        self.concurrent_menu.set(str(self.app.transfer_settings["max_concurrent_transfers"]))
+        self.concurrent_menu.grid(row=0, column=1, sticky="e", padx=10, pady=2)
+        self.limit_entries = {}
+        for row, (key, text) in enumerate((("upload_limit_kb_per_sec", "Upload limit (KB/s, 0 = off):"),
+                                           ("download_limit_kb_per_sec", "Download limit (KB/s, 0 = off):")), start=1):
+            ctk.CTkLabel(transfer_frame, text=text, font=ctk.CTkFont(
+                size=14)).grid(row=row, column=0, sticky="w", padx=10, pady=2)
+            entry = ctk.CTkEntry(transfer_frame, width=80)
+            entry.insert(0, str(self.app.transfer_settings[key]))
+            entry.grid(row=row, column=1, sticky="e", padx=10, pady=2)
+            self.limit_entries[key] = entry
+
         ctk.CTkButton(self, text="Check for Updates",
                       font=ctk.CTkFont(size=14)).pack(pady=10)
         ctk.CTkButton(self, text="Close", command=self.destroy_dialog,
                       font=ctk.CTkFont(size=14)).pack(pady=10)
 
+    def _apply_transfer_settings(self):
+        settings = {"max_concurrent_transfers": int(self.concurrent_menu.get())}
+        for key, entry in self.limit_entries.items():
+            try:
+                settings[key] = max(0, int(entry.get()))
+            except ValueError:
+                settings[key] = self.app.transfer_settings[key]
+        self.app.apply_transfer_settings(settings)
+
     def _on_close(self):
+        self._apply_transfer_settings()
         if hasattr(self.master, 'attributes'):
             self.master.attributes('-alpha', 1.0)
         self.destroy()
@@ -101,16 +1473,55 @@ class VortexTunnelApp(ctk.CTkFrame):
         self.my_name, self.peer_name = None, None
         self.config_file = os.path.join(app_data_dir, "config.json")
         self.chat_history_file = os.path.join(app_data_dir, "chat_history.log")
+        self.chat_index = ChatIndex(
+            os.path.join(app_data_dir, "chat_index.json"), self.chat_history_file)
+        self.search_results, self.search_position = [], 0
+        self.highlighted_message, self.search_job = None, None
         self.downloads_folder = os.path.join(app_data_dir, "Vortex_Downloads")
         os.makedirs(self.downloads_folder, exist_ok=True)
+        self.downloads_watcher = DownloadsWatcher(
+            self.downloads_folder, os.path.join(
+                app_data_dir, "downloads_snapshot.json"),
+            lambda *changes: self.after(0, self._on_downloads_changed, *changes))
         self.file_gallery_metadata_file = os.path.join(
             app_data_dir, "file_gallery.json")
+        self.vault_folder = os.path.join(app_data_dir, "Vortex_Vault")
+        self.vault = VaultIndex(self.vault_folder, os.path.join(
+            app_data_dir, "vault_index.json"))
+        self.vault_downloads = {}
 
         self.host_ip_listen, self.port = "0.0.0.0", 12345
+        # Bulk file data travels on its own tuned connection
+        self.bulk_port = self.port + 1
         self.connection, self.connected = None, threading.Event()
+        self.bulk_connection = None
+        self.scheduler, self.bulk_scheduler = None, None
+        self.incoming_transfers = {}
+        # Commands made while disconnected, and the newest offline command
+        # applied from each peer's outbox
+        self.outbox = Outbox(os.path.join(app_data_dir, "outbox.jsonl"))
+        self.outbox_lock = threading.Lock()
+        self.outbox_seen_file = os.path.join(app_data_dir, "outbox_seen.json")
+        self.outbox_seen = {}
+        if os.path.exists(self.outbox_seen_file):
+            try:
+                with open(self.outbox_seen_file, 'r') as f:
+                    self.outbox_seen = json.load(f)
+            except Exception as e:
+                print(f"Error loading outbox state: {e}")
+        self.transfer_settings = {"max_concurrent_transfers": 2,
+                                  "upload_limit_kb_per_sec": 0,
+                                  "download_limit_kb_per_sec": 0}
+        self.transfer_manager = TransferManager()
+        self.transfer_rows = {}
         self.pending_transfers, self.chat_messages = {}, {}
         self.file_gallery_items_metadata = {}
         self.file_gallery_widgets = {}
+        # Tiles for files still arriving, keyed like the metadata
+        self.pending_gallery = {}
+        self.previews = {}
+        self.thumbnails_folder = os.path.join(app_data_dir, "thumbnails")
+        os.makedirs(self.thumbnails_folder, exist_ok=True)
         # Profiles mapping
         self.profiles = {"Majid": "100.93.161.73",
                          "Nathan": "100.122.120.65", "Majid 2.0": "100.92.141.68"}
@@ -120,6 +1531,7 @@ class VortexTunnelApp(ctk.CTkFrame):
 
         self._create_widgets()
         self.load_config_and_history()
+        self.downloads_watcher.start()
         self.start_server()
 
     def _create_widgets(self):
@@ -142,6 +1554,14 @@ class VortexTunnelApp(ctk.CTkFrame):
         self.pin_button = ctk.CTkButton(top_frame, text="📌", width=30, font=ctk.CTkFont(
             size=18), command=self.toggle_topmost)
         self.pin_button.pack(side="left", padx=5, pady=5)
+        self.vault_button = ctk.CTkButton(top_frame, text="🗄️", width=30, font=ctk.CTkFont(
+            size=18), command=lambda: os.startfile(self.vault_folder))
+        self.vault_button.pack(side="left", padx=5, pady=5)
+        Tooltip(self.vault_button, "Open vault folder")
+        self.sync_button = ctk.CTkButton(top_frame, text="🔄", width=30, font=ctk.CTkFont(
+            size=18), command=self.sync_vault)
+        self.sync_button.pack(side="left", padx=5, pady=5)
+        Tooltip(self.sync_button, "Sync vault with peer")
         self.is_pinned = False
 
         # Removed 'segmented_button_font' as it's not a supported argument
@@ -153,6 +1573,7 @@ class VortexTunnelApp(ctk.CTkFrame):
         self.tab_view.add("Files")
         self.tab_view.add("Drawing")
         self.tab_view.add("Chat")
+        self.tab_view.add("Screen")
 
         # Removed the problematic _text_label configuration (it was already removed in the previous fix,
         # but just double-checking to ensure no re-introduction)
@@ -160,6 +1581,7 @@ class VortexTunnelApp(ctk.CTkFrame):
         self._create_files_tab()  # Create files tab first
         self._create_drawing_tab()
         self._create_chat_tab()
+        self._create_screen_tab()
 
         self.tab_view.set("Files")  # Set Files tab as default
 
@@ -191,11 +1613,24 @@ class VortexTunnelApp(ctk.CTkFrame):
     def _create_chat_tab(self):
         chat_tab = self.tab_view.tab("Chat")
         chat_tab.grid_columnconfigure(0, weight=1)
-        chat_tab.grid_rowconfigure(0, weight=1)
+        chat_tab.grid_rowconfigure(1, weight=1)
+        search_frame = ctk.CTkFrame(chat_tab, fg_color="transparent")
+        search_frame.grid(row=0, column=0, sticky="ew")
+        search_frame.grid_columnconfigure(0, weight=1)
+        self.chat_search_entry = ctk.CTkEntry(
+            search_frame, placeholder_text="Search chat...", font=ctk.CTkFont(size=14))
+        self.chat_search_entry.grid(
+            row=0, column=0, padx=5, pady=5, sticky="ew")
+        self.chat_search_entry.bind("<KeyRelease>", self._on_chat_search)
+        self.chat_search_entry.bind(
+            "<Escape>", lambda e: self._clear_chat_search())
+        self.chat_search_label = ctk.CTkLabel(
+            search_frame, text="", width=80, font=ctk.CTkFont(size=12))
+        self.chat_search_label.grid(row=0, column=1, padx=5)
         self.chat_frame = ctk.CTkScrollableFrame(chat_tab)
-        self.chat_frame.grid(row=0, column=0, sticky="nsew")
+        self.chat_frame.grid(row=1, column=0, sticky="nsew")
         input_frame = ctk.CTkFrame(chat_tab, fg_color="transparent")
-        input_frame.grid(row=1, column=0, sticky="ew")
+        input_frame.grid(row=2, column=0, sticky="ew")
         input_frame.grid_columnconfigure(0, weight=1)
 
         self.chat_entry = ctk.CTkEntry(
@@ -206,6 +1641,131 @@ class VortexTunnelApp(ctk.CTkFrame):
             size=14), command=self.send_chat_message)
         self.send_button.grid(row=0, column=1, padx=5, pady=5)
 
+    def _create_screen_tab(self):
+        screen_tab = self.tab_view.tab("Screen")
+        screen_tab.grid_columnconfigure(0, weight=1)
+        screen_tab.grid_rowconfigure(1, weight=1)
+        controls = ctk.CTkFrame(screen_tab)
+        controls.grid(row=0, column=0, sticky="ew")
+        self.share_button = ctk.CTkButton(controls, text="Share Screen", font=ctk.CTkFont(
+            size=14), command=self.toggle_screen_share)
+        self.share_button.pack(side="left", padx=5, pady=5)
+        self.screen_stats_label = ctk.CTkLabel(
+            controls, text="", font=ctk.CTkFont(size=12))
+        self.screen_stats_label.pack(side="left", padx=10)
+        self.screen_view = tk.Label(
+            screen_tab, bg="#1a1a1a", text="Peer is not sharing", fg="gray")
+        self.screen_view.grid(row=1, column=0, sticky="nsew")
+        self.screen_sharer = None
+        self.screen_decoder = FrameDecoder()
+        self.screen_parts = bytearray()  # frame being reassembled
+        self.screen_frame_sent = threading.Event()
+        self.screen_lock = threading.Lock()
+        self.screen_update_pending = False
+        self.screen_stats_time = 0
+
+    def toggle_screen_share(self):
+        if self.screen_sharer and self.screen_sharer.running:
+            self.stop_screen_share()
+            return
+        if not self.connection:
+            self.update_status("Connect to a peer before sharing", "orange")
+            return
+        self.screen_sharer = ScreenSharer(
+            ScreenGrabSource(), send=self._send_screen_frame,
+            wait_sent=self._wait_screen_sent, on_stats=self._on_screen_stats)
+        self.screen_sharer.start()
+        self.share_button.configure(text="Stop Sharing")
+
+    def stop_screen_share(self, notify_peer=True):
+        if self.screen_sharer:
+            self.screen_sharer.stop()
+            self.screen_sharer = None
+            if notify_peer:
+                self.send_command("SCREEN_STOP")
+        self.share_button.configure(text="Share Screen")
+        self.screen_stats_label.configure(text="")
+
+    def _on_screen_stats(self, rate, dirty_tiles, size):
+        """Called from the sharing thread; refresh the label about once a second."""
+        now = time.monotonic()
+        if now - self.screen_stats_time < 1:
+            return
+        self.screen_stats_time = now
+        text = (f"{rate.fps} fps  ·  quality {rate.quality}  ·  "
+                f"{format_bytes(rate.bandwidth)}/s  ·  {dirty_tiles} tiles")
+        self.after(0, lambda: self.screen_stats_label.configure(text=text))
+
+    def _send_screen_frame(self, payload):
+        """Feed a frame to the socket in parts of at most CHUNK_SIZE.
+
+        Each part waits until little screen data is left in the kernel's send
+        queue, so chat and control messages never queue behind a whole frame.
+        """
+        for start in range(0, len(payload), CHUNK_SIZE):
+            part = payload[start:start + CHUNK_SIZE]
+            last = start + CHUNK_SIZE >= len(payload)
+            self.screen_frame_sent = threading.Event()
+            if not self.send_frame(f"SCREEN_PART:{int(last)}:{len(part)}", part, PRIORITY_SCREEN,
+                                   on_sent=self.screen_frame_sent.set):
+                return False
+            while not last and not self._screen_part_drained(SCREEN_INFLIGHT, 0.5):
+                if not (self.connection and self.screen_sharer and self.screen_sharer.running):
+                    return False
+        return True
+
+    def _screen_part_drained(self, threshold, timeout):
+        """True once the last queued part is written and at most threshold bytes remain unacknowledged."""
+        deadline = time.monotonic() + timeout
+        if not self.screen_frame_sent.wait(timeout):
+            return False
+        # Where the kernel's send queue can't be read, sendall returning is
+        # the best signal available
+        sock = self.connection
+        while sock and (unsent_bytes(sock) or 0) > threshold:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.002)
+        return True
+
+    def _wait_screen_sent(self, timeout):
+        """True once the last frame has drained from the socket, not just left the queue."""
+        return self._screen_part_drained(0, timeout)
+
+    def _on_screen_part(self, last, payload):
+        self.screen_parts += payload
+        if last:
+            frame, self.screen_parts = bytes(self.screen_parts), bytearray()
+            self._on_screen_frame(frame)
+
+    def _on_screen_frame(self, payload):
+        """Decode on the receive thread, then coalesce redraws on the Tk thread."""
+        with self.screen_lock:
+            self.screen_decoder.decode(payload)
+        if not self.screen_update_pending:
+            self.screen_update_pending = True
+            self.after(0, self._show_remote_screen)
+
+    def _show_remote_screen(self):
+        self.screen_update_pending = False
+        with self.screen_lock:
+            if self.screen_decoder.image is None:
+                return
+            img = self.screen_decoder.image.copy()
+        width = max(1, self.screen_view.winfo_width())
+        height = max(1, self.screen_view.winfo_height())
+        img.thumbnail((width, height))
+        photo = ImageTk.PhotoImage(img)
+        self.screen_view.configure(image=photo, text="")
+        self.screen_view.image = photo
+
+    def clear_remote_screen(self):
+        with self.screen_lock:
+            self.screen_decoder = FrameDecoder()
+        self.screen_parts = bytearray()
+        self.screen_view.configure(image="", text="Peer is not sharing")
+        self.screen_view.image = None
+
     def _create_drawing_tab(self):
         draw_tab = self.tab_view.tab("Drawing")
         draw_tab.grid_columnconfigure(0, weight=1)
@@ -263,8 +1823,111 @@ class VortexTunnelApp(ctk.CTkFrame):
         for i in range(4):
             self.gallery_container.grid_columnconfigure(
                 i, weight=1, uniform="file_item")
+        # Active transfers, shown only while there are any
+        files_tab.grid_rowconfigure(2, weight=0)
+        self.transfers_frame = ctk.CTkFrame(files_tab)
+        self.transfers_frame.grid(row=2, column=0, sticky="ew", pady=(5, 0))
+        self.transfers_frame.grid_columnconfigure(0, weight=1)
+        self.transfers_frame.grid_remove()
+        self.after(500, self._refresh_transfers)
         # Populate initial view
         self._apply_filter_search()
+
+    def _create_transfer_row(self, transfer):
+        row = ctk.CTkFrame(self.transfers_frame, fg_color="transparent")
+        row.grid_columnconfigure(0, weight=1)
+        row.label = ctk.CTkLabel(row, text="", anchor="w",
+                                 font=ctk.CTkFont(size=12))
+        row.label.grid(row=0, column=0, sticky="ew", padx=5)
+        row.bar = ctk.CTkProgressBar(row, height=8)
+        row.bar.grid(row=1, column=0, sticky="ew", padx=5, pady=(0, 4))
+        row.pause_button = ctk.CTkButton(row, text="⏸", width=30,
+                                         command=lambda fid=transfer.file_id: self.toggle_transfer_pause(fid))
+        row.pause_button.grid(row=0, column=1, rowspan=2, padx=2)
+        row.cancel_button = ctk.CTkButton(row, text="✕", width=30, fg_color="#D32F2F", hover_color="#B71C1C",
+                                          command=lambda fid=transfer.file_id: self.cancel_transfer(fid))
+        row.cancel_button.grid(row=0, column=2, rowspan=2, padx=(2, 5))
+        row.pack(fill="x")
+        self.transfer_rows[transfer.file_id] = row
+        return row
+
+    def _describe_transfer(self, transfer):
+        arrow = {"up": "↑", "down": "↓", "export": "⇥"}[transfer.direction]
+        percent = 100 * transfer.done / transfer.total if transfer.total else 100
+        text = f"{arrow} {transfer.filename}  {percent:.0f}%  of {format_bytes(transfer.total)}"
+        if transfer.state == "active":
+            text += f"  ·  {format_bytes(transfer.throughput())}/s"
+            eta = transfer.eta()
+            if eta is not None:
+                text += f"  ·  ETA {int(eta) // 60}:{int(eta) % 60:02d}"
+        else:
+            text += f"  ·  {transfer.state.capitalize()}"
+        if transfer.state == "done" and transfer.verify_seconds:
+            text += f" (hashing {transfer.verify_seconds * 1000:.0f} ms)"
+        return text
+
+    def _refresh_transfers(self):
+        """Periodically redraw transfer progress from the manager's state."""
+        self.transfer_manager.prune()
+        transfers = self.transfer_manager.snapshot()
+        current = {t.file_id for t in transfers}
+        for file_id in list(self.transfer_rows):
+            if file_id not in current:
+                self.transfer_rows.pop(file_id).destroy()
+        for transfer in transfers:
+            row = self.transfer_rows.get(
+                transfer.file_id) or self._create_transfer_row(transfer)
+            row.label.configure(text=self._describe_transfer(transfer))
+            row.bar.set(transfer.done /
+                        transfer.total if transfer.total else 1)
+            row.pause_button.configure(
+                text="▶" if transfer.state == "paused" else "⏸",
+                state="normal" if transfer.state in ("active", "paused") else "disabled")
+            row.cancel_button.configure(
+                state="disabled" if transfer.finished else "normal")
+        if transfers:
+            self.transfers_frame.grid()
+        else:
+            self.transfers_frame.grid_remove()
+        self._refresh_pending_gallery_tiles()
+        self.after(500, self._refresh_transfers)
+
+    def toggle_transfer_pause(self, file_id):
+        transfer = self.transfer_manager.get(file_id)
+        if not transfer:
+            return
+        if transfer.state == "active":
+            transfer.pause()
+            if transfer.direction != "export":
+                self.send_command(f"FILE_PAUSE:{file_id}")
+        elif transfer.state == "paused":
+            transfer.resume()
+            if transfer.direction != "export":
+                self.send_command(f"FILE_RESUME:{file_id}")
+
+    def cancel_transfer(self, file_id):
+        transfer = self.transfer_manager.get(file_id)
+        if not transfer or transfer.finished:
+            return
+        if transfer.direction != "export":
+            self.send_command(f"FILE_CANCEL:{file_id}")
+        self._cancel_transfer_locally(file_id)
+
+    def _cancel_transfer_locally(self, file_id):
+        transfer = self.transfer_manager.get(file_id)
+        if transfer:
+            transfer.cancel()
+        if transfer and transfer.direction == "down":
+            self._abort_incoming_file(file_id)
+        self.pending_transfers.pop(file_id, None)
+        self.transfer_manager.finish(file_id, "cancelled")
+
+    def apply_transfer_settings(self, settings):
+        self.transfer_settings.update(settings)
+        self.transfer_manager.configure(
+            self.transfer_settings["max_concurrent_transfers"],
+            self.transfer_settings["upload_limit_kb_per_sec"] * 1024,
+            self.transfer_settings["download_limit_kb_per_sec"] * 1024)
     # Placeholder method for drag-drop label visibility (stub for compatibility)
 
     def _update_drag_drop_label_visibility(self):
@@ -288,7 +1951,9 @@ class VortexTunnelApp(ctk.CTkFrame):
         for widget in self.file_gallery_widgets.values():
             widget.grid_forget()
         row, col = 0, 0
-        for file_id, data in self.file_gallery_items_metadata.items():
+        items = list(self.file_gallery_items_metadata.items()) + \
+            list(self.pending_gallery.items())
+        for file_id, data in items:
             name = data['filename']
             local = data['local_path']
             # Filter by state
@@ -327,7 +1992,10 @@ class VortexTunnelApp(ctk.CTkFrame):
             clean_path = path
             if clean_path.startswith("{") and clean_path.endswith("}"):
                 clean_path = clean_path[1:-1]
-            self.send_file(clean_path)
+            if os.path.isdir(clean_path):
+                self.send_folder(clean_path)
+            else:
+                self.send_file(clean_path)
 
     def add_chat_message(self, msg_id, sender, message, is_own, is_file=False, file_info=None):
         if msg_id in self.chat_messages:
@@ -390,20 +2058,87 @@ class VortexTunnelApp(ctk.CTkFrame):
             messagebox.showinfo(
                 "Cannot Edit", "This message type cannot be edited.")
 
+    def _on_chat_search(self, event):
+        """Search once typing pauses; Enter steps through older matches."""
+        if event.keysym == "Escape":
+            return
+        if event.keysym == "Return" and self.search_results:
+            self.search_position = (
+                self.search_position + 1) % len(self.search_results)
+            self._show_search_result()
+            return
+        if self.search_job:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(150, self._run_chat_search)
+
+    def _run_chat_search(self):
+        self.search_job = None
+        query = self.chat_search_entry.get()
+        # Only messages currently shown can be jumped to
+        self.search_results = [msg_id for msg_id in self.chat_index.search(query)
+                               if msg_id in self.chat_messages]
+        self.search_position = 0
+        if not query.strip():
+            self.chat_search_label.configure(text="")
+            self._highlight_message(None)
+            return
+        self._show_search_result()
+
+    def _show_search_result(self):
+        if not self.search_results:
+            self.chat_search_label.configure(text="No matches")
+            self._highlight_message(None)
+            return
+        self.chat_search_label.configure(
+            text=f"{self.search_position + 1}/{len(self.search_results)}")
+        self._highlight_message(self.search_results[self.search_position])
+
+    def _highlight_message(self, msg_id):
+        if self.highlighted_message in self.chat_messages:
+            self.chat_messages[self.highlighted_message].winfo_children()[
+                0].configure(border_width=0)
+        self.highlighted_message = msg_id
+        if msg_id not in self.chat_messages:
+            return
+        row_frame = self.chat_messages[msg_id]
+        row_frame.winfo_children()[0].configure(
+            border_width=2, border_color="#1f6aa5")
+        # Scroll so the message sits near the top of the view
+        self.chat_frame.update_idletasks()
+        height = self.chat_frame.winfo_height()
+        if height:
+            self.chat_frame._parent_canvas.yview_moveto(
+                max(0, row_frame.winfo_y() - 10) / height)
+
+    def _clear_chat_search(self):
+        self.chat_search_entry.delete(0, tk.END)
+        self.chat_search_label.configure(text="")
+        self.search_results = []
+        self._highlight_message(None)
+
     def confirm_clear_chat(self):
         if messagebox.askyesno("Confirm", "Are you sure you want to clear the chat history for everyone?"):
             self.send_command("CLEAR_CHAT")
 
-    def add_file_to_gallery(self, file_id, filename, local_path):
-        """Adds a new file entry to metadata, creates widget, and refreshes layout."""
-        if not os.path.exists(local_path):
+    def add_file_to_gallery(self, file_id, filename, local_path, loading=False):
+        """Adds a new file entry to metadata, creates widget, and refreshes layout.
+
+        With loading=True the caller has already checked the file and saves
+        the metadata once itself.
+        """
+        if not loading and not os.path.exists(local_path):
             print(
                 f"File not found at {local_path}, skipping gallery addition.")
             return
         # Store metadata and persist
         self.file_gallery_items_metadata[file_id] = {
             "filename": filename, "local_path": local_path}
-        self._save_file_gallery_metadata()
+        if not loading:
+            self._save_file_gallery_metadata()
+        # Replace the tile shown while the file was arriving
+        if file_id in self.pending_gallery:
+            del self.pending_gallery[file_id]
+            self.file_gallery_widgets.pop(file_id).destroy()
         # Avoid duplicate widgets
         if file_id in self.file_gallery_widgets:
             return
@@ -413,19 +2148,12 @@ class VortexTunnelApp(ctk.CTkFrame):
                                   border_width=1, border_color="gray30")
         file_frame.grid_propagate(False)
         # Thumbnail or icon
-        try:
-            img = Image.open(local_path)
-            img.thumbnail((96, 96))
-            thumb = ImageTk.PhotoImage(img)
-            ctk.CTkLabel(file_frame, image=thumb, text="").pack(pady=(10, 5))
-            file_frame.image = thumb
-        except Exception:
-            ctk.CTkLabel(file_frame, text="📄", font=("Arial", 48), width=96,
-                         height=96, fg_color="gray25", corner_radius=6).pack(pady=(10, 5))
+        self._pack_gallery_thumbnail(file_frame, file_id, local_path)
         # Filename and extension
         ctk.CTkLabel(file_frame, text=filename, wraplength=120,
                      font=ctk.CTkFont(size=13, weight="bold")).pack()
-        ext = os.path.splitext(filename)[1].upper()[1:] or "FILE"
+        ext = "FOLDER" if os.path.isdir(local_path) else os.path.splitext(filename)[
+            1].upper()[1:] or "FILE"
         ctk.CTkLabel(file_frame, text=ext, font=("Arial", 11, "italic"),
                      text_color="gray").pack(pady=(0, 5))
         # Buttons
@@ -448,6 +2176,142 @@ class VortexTunnelApp(ctk.CTkFrame):
         self.file_gallery_widgets[file_id] = file_frame
         self._apply_filter_search()
 
+    def _gallery_thumbnail(self, file_id, local_path):
+        """Thumbnail from the preview cache; only decodes the image if no preview exists."""
+        cache_path = os.path.join(self.thumbnails_folder, f"{file_id}.jpg")
+        try:
+            if not os.path.exists(cache_path):
+                if not local_path or os.path.isdir(local_path):
+                    return None
+                preview = make_preview(local_path)
+                if not preview:
+                    return None
+                with open(cache_path, 'wb') as f:
+                    f.write(preview[0])
+            return ImageTk.PhotoImage(Image.open(cache_path))
+        except Exception as e:
+            print(f"Error loading thumbnail: {e}")
+            return None
+
+    def _pack_gallery_thumbnail(self, file_frame, file_id, local_path, is_dir=None):
+        thumb = self._gallery_thumbnail(file_id, local_path)
+        if thumb:
+            ctk.CTkLabel(file_frame, image=thumb, text="").pack(pady=(10, 5))
+            file_frame.image = thumb
+        else:
+            if is_dir is None:
+                is_dir = os.path.isdir(local_path)
+            icon = "📁" if is_dir else "📄"
+            ctk.CTkLabel(file_frame, text=icon, font=("Arial", 48), width=96,
+                         height=96, fg_color="gray25", corner_radius=6).pack(pady=(10, 5))
+
+    def _add_pending_gallery_tile(self, file_id, filename, filesize, is_dir=False):
+        """Show an incoming file right away, using the sender's preview if one came."""
+        if file_id in self.file_gallery_widgets:
+            return
+        local_path = os.path.join(
+            self.downloads_folder, f"{file_id}_{filename}")
+        file_frame = ctk.CTkFrame(self.gallery_container, width=150, height=150,
+                                  corner_radius=10, fg_color="gray15",
+                                  border_width=1, border_color="gray30")
+        file_frame.grid_propagate(False)
+        self._pack_gallery_thumbnail(file_frame, file_id, None, is_dir)
+        ctk.CTkLabel(file_frame, text=filename, wraplength=120,
+                     font=ctk.CTkFont(size=13, weight="bold")).pack()
+        dimensions = self.previews.pop(file_id, None)
+        details = format_bytes(filesize)
+        if dimensions:
+            details = f"{dimensions[0]}×{dimensions[1]}  ·  {details}"
+        ctk.CTkLabel(file_frame, text=details, font=("Arial", 11, "italic"),
+                     text_color="gray").pack()
+        file_frame.progress_bar = ctk.CTkProgressBar(
+            file_frame, width=110, height=8)
+        file_frame.progress_bar.set(0)
+        file_frame.progress_bar.pack(pady=(5, 0))
+        file_frame.progress_label = ctk.CTkLabel(
+            file_frame, text="Waiting...", font=("Arial", 11))
+        file_frame.progress_label.pack(pady=(0, 10))
+        self.pending_gallery[file_id] = {
+            "filename": filename, "local_path": local_path}
+        self.file_gallery_widgets[file_id] = file_frame
+        self._apply_filter_search()
+
+    def _refresh_pending_gallery_tiles(self):
+        for file_id in list(self.pending_gallery):
+            transfer = self.transfer_manager.get(file_id)
+            if not transfer or transfer.state in ("cancelled", "failed"):
+                del self.pending_gallery[file_id]
+                self.file_gallery_widgets.pop(file_id).destroy()
+                self._apply_filter_search()
+                continue
+            tile = self.file_gallery_widgets[file_id]
+            fraction = transfer.done / transfer.total if transfer.total else 1
+            tile.progress_bar.set(fraction)
+            if transfer.state != "queued":
+                tile.progress_label.configure(
+                    text=f"Receiving {fraction:.0%}")
+
+    def _in_downloads(self, path):
+        return os.path.dirname(path) == self.downloads_folder
+
+    def _split_download_name(self, name):
+        """Recover (file_id, filename) from a "<file_id>_<filename>" download name."""
+        prefix, _, rest = name.partition("_")
+        try:
+            uuid.UUID(prefix)
+            return prefix, rest
+        except ValueError:
+            return str(uuid.uuid4()), name
+
+    def _remove_gallery_item(self, file_id, keep_thumbnail=False):
+        self.file_gallery_items_metadata.pop(file_id, None)
+        widget = self.file_gallery_widgets.pop(file_id, None)
+        if widget:
+            widget.destroy()
+        if not keep_thumbnail:
+            try:
+                os.remove(os.path.join(
+                    self.thumbnails_folder, f"{file_id}.jpg"))
+            except OSError:
+                pass
+
+    def _on_downloads_changed(self, added, removed, moved, changed):
+        """Bring the gallery in line with changes seen in the downloads folder."""
+        by_path = {data["local_path"]: file_id
+                   for file_id, data in self.file_gallery_items_metadata.items()}
+
+        def path(name):
+            return os.path.join(self.downloads_folder, name)
+        for name in removed:
+            if path(name) in by_path:
+                self._remove_gallery_item(by_path[path(name)])
+        for old, new in moved:
+            file_id = by_path.get(path(old))
+            if file_id:
+                self._remove_gallery_item(file_id, keep_thumbnail=True)
+                self.add_file_to_gallery(
+                    file_id, self._split_download_name(new)[1], path(new), loading=True)
+            else:
+                added.append(new)
+        for name in changed:
+            file_id = by_path.get(path(name))
+            if file_id:
+                data = self.file_gallery_items_metadata[file_id]
+                self._remove_gallery_item(file_id)
+                self.add_file_to_gallery(
+                    file_id, data["filename"], data["local_path"], loading=True)
+        for name in added:
+            if path(name) in by_path:
+                continue
+            file_id, filename = self._split_download_name(name)
+            # Files still being received are added when they are verified
+            if file_id in self.incoming_transfers or file_id in self.file_gallery_items_metadata:
+                continue
+            self.add_file_to_gallery(
+                file_id, filename, path(name), loading=True)
+        self._save_file_gallery_metadata()
+        self._apply_filter_search()
+
     def _save_file_gallery_metadata(self):
         files_to_save = []
         for file_id, data in self.file_gallery_items_metadata.items():
@@ -477,11 +2341,14 @@ class VortexTunnelApp(ctk.CTkFrame):
                 if last_peer and last_peer in self.profiles:
                     self.peer_menu.set(last_peer)
                     self._peer_selected(last_peer)
+                self.apply_transfer_settings(
+                    {key: config[key] for key in self.transfer_settings if key in config})
 
             if os.path.exists(self.chat_history_file):
                 with open(self.chat_history_file, 'r') as f:
                     for line in f:
                         self.process_command(line.strip(), from_history=True)
+            self.chat_index.catch_up()
 
             # Load file gallery metadata
             if os.path.exists(self.file_gallery_metadata_file):
@@ -489,23 +2356,33 @@ class VortexTunnelApp(ctk.CTkFrame):
                     loaded_files = json.load(f)
                 self.gallery_item_row_counter = 0
                 self.gallery_item_col_counter = 0
-                valid_files = []
                 for file_data in loaded_files:
                     file_id = file_data.get("file_id")
                     filename = file_data.get("filename")
                     local_path = file_data.get("local_path")
-                    if file_id and filename and local_path and os.path.exists(local_path):
-                        valid_files.append(file_data)
-                        self.add_file_to_gallery(file_id, filename, local_path)
+                    # Received files are checked against the downloads
+                    # snapshot below; only sent files need a stat here
+                    if file_id and filename and local_path and (
+                            self._in_downloads(local_path) or os.path.exists(local_path)):
+                        self.file_gallery_items_metadata[file_id] = {
+                            "filename": filename, "local_path": local_path}
                     else:
                         print(
                             f"Skipping invalid/missing file from history: {file_data}")
-                self.file_gallery_items_metadata = {
-                    f['file_id']: f for f in valid_files}
-                self._save_file_gallery_metadata()
-                # Update visibility and layout after loading history
-                self._update_drag_drop_label_visibility()
-                self._apply_filter_search()
+            # Apply whatever changed in the downloads folder while closed
+            self._on_downloads_changed(*self.downloads_watcher.reconcile())
+            present = self.downloads_watcher.snapshot
+            for file_id, data in list(self.file_gallery_items_metadata.items()):
+                local_path = data["local_path"]
+                if self._in_downloads(local_path) and os.path.basename(local_path) not in present:
+                    del self.file_gallery_items_metadata[file_id]
+                elif file_id not in self.file_gallery_widgets:
+                    self.add_file_to_gallery(
+                        file_id, data["filename"], local_path, loading=True)
+            self._save_file_gallery_metadata()
+            # Update visibility and layout after loading history
+            self._update_drag_drop_label_visibility()
+            self._apply_filter_search()
 
         except Exception as e:
             print(f"Error loading config or history: {e}")
@@ -514,7 +2391,8 @@ class VortexTunnelApp(ctk.CTkFrame):
         # Save last used profile and peer selections
         config = {
             "last_profile": self.identity_menu.get() if self.my_name else None,
-            "last_peer": self.peer_menu.get() if self.peer_name else None
+            "last_peer": self.peer_menu.get() if self.peer_name else None,
+            **self.transfer_settings
         }
         try:
             with open(self.config_file, 'w') as f:
@@ -523,7 +2401,14 @@ class VortexTunnelApp(ctk.CTkFrame):
             print(f"Error saving config: {e}")
 
         self._save_file_gallery_metadata()
-
+        self.vault.save()
+        self.chat_index.save()
+        self.downloads_watcher.stop()
+        self.downloads_watcher.save()
+
+        self._drop_bulk_connection()
+        if self.scheduler:
+            self.scheduler.close()
         if self.connection:
             self.connection.close()
         self.master.destroy()
@@ -567,17 +2452,82 @@ class VortexTunnelApp(ctk.CTkFrame):
                 _, file_id, filename, filesize = command_str.split(":", 3)
                 self.pending_transfers[file_id] = {
                     "filename": filename, "filesize": int(filesize)}
-                self.send_command(f"FILE_ACCEPT:{file_id}")
+                self.transfer_manager.add(
+                    Transfer(file_id, filename, int(filesize), "down"))
+                self.after(0, self._add_pending_gallery_tile,
+                           file_id, filename, int(filesize))
+                # Accept once a download slot is free
+                self.transfer_manager.start(
+                    file_id, lambda fid=file_id: self.send_command(f"FILE_ACCEPT:{fid}"))
                 self.update_status(
                     f"Automatically accepting incoming file: '{filename}'", "blue")
+            elif cmd == "BUNDLE_REQUEST":
+                _, file_id, dirname, bundle_size, count = command_str.split(
+                    ":", 4)
+                self.pending_transfers[file_id] = {
+                    "filename": dirname, "filesize": int(bundle_size), "bundle": True}
+                self.transfer_manager.add(
+                    Transfer(file_id, dirname, int(bundle_size), "down"))
+                self.after(0, self._add_pending_gallery_tile,
+                           file_id, dirname, int(bundle_size), True)
+                self.transfer_manager.start(
+                    file_id, lambda fid=file_id: self.send_command(f"FILE_ACCEPT:{fid}"))
+                self.update_status(
+                    f"Automatically accepting folder '{dirname}' ({count} files)", "blue")
             elif cmd == "FILE_ACCEPT":
                 _, file_id = command_str.split(":", 1)
                 if file_id in self.pending_transfers:
-                    threading.Thread(target=self._send_file_data, args=(
-                        file_id,), daemon=True).start()
+                    self._start_upload(file_id)
                 else:
                     print(
                         f"Received FILE_ACCEPT for unknown file_id: {file_id}")
+            elif cmd == "FILE_START_TRANSFER":
+                _, file_id, filename, filesize = command_str.split(":", 3)
+                self._start_incoming_file(file_id, filename, int(filesize))
+            elif cmd == "FILE_END":
+                _, file_id, file_digest = command_str.split(":", 2)
+                self._verify_incoming_file(file_id, file_digest)
+            elif cmd == "FILE_RESEND":
+                _, file_id, offsets = command_str.split(":", 2)
+                threading.Thread(target=self._resend_chunks, args=(
+                    file_id, [int(o) for o in offsets.split(",")]), daemon=True).start()
+            elif cmd == "FILE_VERIFIED":
+                _, file_id = command_str.split(":", 1)
+                self.pending_transfers.pop(file_id, None)
+                self.transfer_manager.finish(file_id)
+                self.update_status("File verified by peer", "green")
+            elif cmd == "FILE_PAUSE":
+                _, file_id = command_str.split(":", 1)
+                if self.transfer_manager.get(file_id):
+                    self.transfer_manager.get(file_id).pause()
+            elif cmd == "FILE_RESUME":
+                _, file_id = command_str.split(":", 1)
+                if self.transfer_manager.get(file_id):
+                    self.transfer_manager.get(file_id).resume()
+            elif cmd == "FILE_CANCEL":
+                _, file_id = command_str.split(":", 1)
+                self._cancel_transfer_locally(file_id)
+            elif cmd == "VAULT_SYNC":
+                threading.Thread(target=self._announce_vault,
+                                 daemon=True).start()
+            elif cmd == "VAULT_ROOT":
+                _, root_hash = command_str.split(":", 1)
+                if root_hash != self.vault.root_hash:
+                    self.send_command("VAULT_LIST:")
+            elif cmd == "VAULT_LIST":
+                _, rel_dir = command_str.split(":", 1)
+                self.send_frame_json("VAULT_NODE", self.vault.node(rel_dir))
+            elif cmd == "VAULT_FILE":
+                _, rel = command_str.split(":", 1)
+                manifest = self.vault.manifest(rel)
+                if manifest:
+                    self.send_frame_json("VAULT_MANIFEST", manifest)
+            elif cmd == "VAULT_GET":
+                _, token, indices, rel = command_str.split(":", 3)
+                threading.Thread(target=self._serve_vault_chunks, args=(
+                    token, rel, [int(i) for i in indices.split(",")]), daemon=True).start()
+            elif cmd == "SCREEN_STOP":
+                self.clear_remote_screen()
             elif cmd == "FILE_REJECT":
                 _, file_id = command_str.split(":", 1)
                 if file_id in self.pending_transfers:
@@ -590,15 +2540,23 @@ class VortexTunnelApp(ctk.CTkFrame):
                 self.add_file_to_gallery(file_id, filename, local_path)
             elif cmd == "REQUEST_DOWNLOAD":
                 _, file_id = command_str.split(":", 1)
-                if file_id in self.file_gallery_items_metadata:
+                if file_id in self.file_gallery_items_metadata and os.path.isdir(
+                        self.file_gallery_items_metadata[file_id]['local_path']):
+                    # Folders need the peer to set up an extractor first
+                    data = self.file_gallery_items_metadata[file_id]
+                    self._offer_folder(
+                        file_id, data['filename'], data['local_path'])
+                elif file_id in self.file_gallery_items_metadata:
                     filepath_to_send = self.file_gallery_items_metadata[file_id]['local_path']
                     self.pending_transfers[file_id] = {
                         "filepath": filepath_to_send,
                         "filename": os.path.basename(filepath_to_send),
                         "filesize": os.path.getsize(filepath_to_send)
                     }
-                    threading.Thread(target=self._send_file_data, args=(
-                        file_id,), daemon=True).start()
+                    self.transfer_manager.add(Transfer(
+                        file_id, os.path.basename(filepath_to_send),
+                        os.path.getsize(filepath_to_send), "up"))
+                    self._start_upload(file_id)
                 else:
                     print(
                         f"Error: Peer requested download for unknown file_id: {file_id}")
@@ -610,135 +2568,603 @@ class VortexTunnelApp(ctk.CTkFrame):
                 self.delete_file(file_id, local_path_to_delete,
                                  is_remote_command=True)
 
+            elif cmd == "OUTBOX_ACK":
+                _, outbox_id, seq = command_str.split(":", 2)
+                if outbox_id == self.outbox.id:
+                    self.outbox.ack(int(seq))
+
             if not from_history:
                 self.notify_user()
-            if not from_history and cmd in ["CHAT_MSG", "EDIT_MSG", "DELETE_MSG", "CLEAR_CHAT", "ADD_TO_GALLERY", "DELETE_FILE_COMMAND"]:
-                with open(self.chat_history_file, 'a' if cmd != "CLEAR_CHAT" else 'w') as f:
-                    if cmd != "CLEAR_CHAT":
-                        f.write(command_str + '\n')
+                self._log_history([command_str])
         except Exception as e:
             print(f"Error processing command: {e} -> '{command_str}'")
 
-    def receive_data(self):
-        buffer = b""
-        separator = b"\n"
-        receiving_file_info = None
-        while self.connected.is_set():
+    def _log_history(self, commands):
+        """Append history commands to the chat log and keep the chat index in step."""
+        commands = [command for command in commands
+                    if command.split(":", 1)[0] in HISTORY_COMMANDS]
+        if not commands:
+            return
+        logged = []  # (command, offset of its line)
+        # The UI and receive threads both log; the index lock keeps each
+        # batch's lines at the offsets recorded for them
+        with self.chat_index.lock:
+            with open(self.chat_history_file, 'a') as f:
+                for command in commands:
+                    if command.split(":", 1)[0] == "CLEAR_CHAT":
+                        f.seek(0)
+                        f.truncate()
+                        logged = [(command, 0)]
+                    else:
+                        logged.append((command, f.tell()))
+                        f.write(command + '\n')
+                end = f.tell()
+            # Indexed once the lines are on disk, since edits read old lines back
+            for command, offset in logged:
+                if command.split(":", 1)[0] in CHAT_INDEX_COMMANDS:
+                    self.chat_index.apply(command, offset)
+            self.chat_index.offset = end
+
+    def _apply_outbox_batch(self, batch):
+        """Apply a peer's offline backlog in one pass, then acknowledge it."""
+        last_seen = self.outbox_seen.get(batch["id"], 0)
+        commands = [command for seq, command in batch["events"]
+                    if seq > last_seen]
+        for command in commands:
+            # Logged and notified once for the whole batch below
+            self.process_command(command, from_history=True)
+        self._log_history(commands)
+        if commands:
+            self.notify_user()
+        self.outbox_seen[batch["id"]] = max(last_seen, batch["last"])
+        try:
+            with open(self.outbox_seen_file, 'w') as f:
+                json.dump(self.outbox_seen, f)
+        except Exception as e:
+            print(f"Error saving outbox state: {e}")
+        self.send_command(f"OUTBOX_ACK:{batch['id']}:{batch['last']}")
+
+    def process_frame(self, header, payload):
+        """Handle a command that carries a binary payload."""
+        try:
+            cmd = header.split(":", 1)[0]
+            if cmd == "FILE_CHUNK":
+                _, file_id, offset, digest, _ = header.split(":", 4)
+                self._write_incoming_chunk(
+                    file_id, int(offset), digest, payload)
+            elif cmd == "OUTBOX_BATCH":
+                # Applied here, like any other command, so the backlog lands
+                # before the live commands that follow it on the stream
+                self._apply_outbox_batch(json.loads(zlib.decompress(payload)))
+            elif cmd == "FILE_PREVIEW":
+                _, file_id, width, height, _ = header.split(":", 4)
+                with open(os.path.join(self.thumbnails_folder, f"{file_id}.jpg"), 'wb') as f:
+                    f.write(payload)
+                self.previews[file_id] = (int(width), int(height))
+            elif cmd == "VAULT_NODE":
+                self._on_vault_node(json.loads(payload))
+            elif cmd == "VAULT_MANIFEST":
+                threading.Thread(target=self._pull_vault_file, args=(
+                    json.loads(payload),), daemon=True).start()
+            elif cmd == "VAULT_CHUNK":
+                _, token, index, _ = header.split(":", 3)
+                self._on_vault_chunk(token, int(index), payload)
+            elif cmd == "SCREEN_PART":
+                _, last, _ = header.split(":", 2)
+                self._on_screen_part(last == "1", payload)
+        except Exception as e:
+            print(f"Error processing frame: {e} -> '{header}'")
+
+    def sync_vault(self):
+        threading.Thread(target=self._announce_vault,
+                         args=(True,), daemon=True).start()
+
+    def _announce_vault(self, ask_peer=False):
+        """Refresh the vault index and offer its root hash to the peer."""
+        changed = self.vault.refresh()
+        print(f"Vault index refreshed, {changed} changed files")
+        self.send_command(f"VAULT_ROOT:{self.vault.root_hash}")
+        if ask_peer:
+            self.send_command("VAULT_SYNC")
+
+    def _on_vault_node(self, node):
+        """Descend only into children whose hashes differ from ours."""
+        rel_dir = node["path"]
+        for name, kind, digest, mtime_ns in node["children"]:
+            rel = f"{rel_dir}/{name}" if rel_dir else name
             try:
-                chunk = self.connection.recv(8192)
-                if not chunk:
-                    self.handle_disconnect()
-                    break
+                self.vault.abs_path(rel)
+            except ValueError as e:
+                print(e)
+                continue
+            local = self.vault.lookup(rel)
+            if local and local[1] == digest:
+                continue
+            if local and (local[0] == "d") != (kind == "d"):
+                print(f"Vault conflict, skipping {rel}")
+            elif kind == "d":
+                self.send_command(f"VAULT_LIST:{rel}")
+            elif not local:
+                if kind == "f":
+                    self.send_command(f"VAULT_FILE:{rel}")
+                else:
+                    self.vault.remove_file(rel, mtime_ns)
+            elif mtime_ns > self.vault.stamp(rel) or (
+                    mtime_ns == self.vault.stamp(rel) and kind == "x"):
+                # The newer of file and deletion wins on both sides (a tie
+                # goes to the deletion); the peer acts on ours when ours wins
+                if kind == "f":
+                    self.send_command(f"VAULT_FILE:{rel}")
+                else:
+                    self.vault.remove_file(rel, mtime_ns)
 
-                if receiving_file_info:
-                    buffer += chunk
-                    filepath, filesize, file_id, original_filename = receiving_file_info['path'], receiving_file_info[
-                        'size'], receiving_file_info['id'], receiving_file_info['original_filename']
-
-                    if len(buffer) >= filesize:
-                        file_data, buffer = buffer[:filesize], buffer[filesize:]
-                        with open(filepath, 'wb') as f:
-                            f.write(file_data)
-                        self.update_status(
-                            f"Successfully received {original_filename}", "green")
-                        self.after(10, self.add_file_to_gallery,
-                                   file_id, original_filename, filepath)
-                        receiving_file_info = None
-                    continue
+    def _pull_vault_file(self, manifest):
+        """Assemble a file from local chunks and request only the missing ones."""
+        rel = manifest["path"]
+        try:
+            self.vault.abs_path(rel)
+        except ValueError as e:
+            print(e)
+            return
+        token = uuid.uuid4().hex
+        tmp_dir = os.path.join(self.vault.root, VAULT_TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        handle = open(os.path.join(tmp_dir, token), 'w+b')
+        handle.truncate(manifest["size"])
+        needed = []
+        for index, digest in enumerate(manifest["chunks"]):
+            data = self.vault.read_chunk(digest)
+            if data is None:
+                needed.append(index)
+            else:
+                handle.seek(index * VAULT_CHUNK_SIZE)
+                handle.write(data)
+        self.vault_downloads[token] = {"manifest": manifest, "handle": handle,
+                                       "needed": set(needed)}
+        if not needed:
+            self._finish_vault_file(token)
+            return
+        self.update_status(
+            f"Syncing {rel}: {len(needed)}/{len(manifest['chunks'])} chunks needed", "white")
+        self.send_command(
+            f"VAULT_GET:{token}:{','.join(map(str, needed))}:{rel}")
 
+    def _serve_vault_chunks(self, token, rel, indices):
+        route = self._bulk_route()
+        try:
+            with open(self.vault.abs_path(rel), 'rb') as f:
+                for index in indices:
+                    f.seek(index * VAULT_CHUNK_SIZE)
+                    data = f.read(VAULT_CHUNK_SIZE)
+                    self.transfer_manager.throttle("up", len(data))
+                    if not self.send_frame(f"VAULT_CHUNK:{token}:{index}:{len(data)}",
+                                           data, scheduler=route):
+                        return
+        except (OSError, ValueError) as e:
+            print(f"Error serving vault file {rel}: {e}")
+
+    def _on_vault_chunk(self, token, index, payload):
+        download = self.vault_downloads.get(token)
+        if not download:
+            return
+        if chunk_digest(payload) != download["manifest"]["chunks"][index]:
+            # The peer's file changed since its manifest; the next sync retries
+            print(f"Vault chunk mismatch for {download['manifest']['path']}")
+            self._abort_vault_download(token)
+            return
+        self.transfer_manager.throttle("down", len(payload))
+        download["handle"].seek(index * VAULT_CHUNK_SIZE)
+        download["handle"].write(payload)
+        download["needed"].discard(index)
+        if not download["needed"]:
+            self._finish_vault_file(token)
+
+    def _finish_vault_file(self, token):
+        download = self.vault_downloads.pop(token)
+        manifest = download["manifest"]
+        download["handle"].close()
+        dest = self.vault.abs_path(manifest["path"])
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(download["handle"].name, dest)
+        os.utime(dest, ns=(manifest["mtime_ns"], manifest["mtime_ns"]))
+        self.vault.record_file(manifest["path"], manifest["size"],
+                               manifest["mtime_ns"], manifest["chunks"])
+        self.update_status(f"Vault synced: {manifest['path']}", "green")
+
+    def _abort_vault_download(self, token):
+        download = self.vault_downloads.pop(token, None)
+        if not download:
+            return
+        try:
+            download["handle"].close()
+            os.remove(download["handle"].name)
+        except OSError as e:
+            print(f"Error removing partial vault file: {e}")
+
+    def _start_incoming_file(self, file_id, filename, filesize):
+        """Open the destination file for an accepted incoming transfer."""
+        transfer = self.transfer_manager.get(file_id)
+        if transfer and transfer.finished:
+            return
+        if not transfer:
+            # Peer-initiated sends such as REQUEST_DOWNLOAD skip FILE_REQUEST
+            transfer = self.transfer_manager.add(
+                Transfer(file_id, filename, filesize, "down"))
+            transfer.state = "active"
+        pending = self.pending_transfers.get(file_id, {})
+        filename = pending.get('filename', filename)
+        save_path = os.path.join(
+            self.downloads_folder, f"{file_id}_{filename}")
+        # Data lands under a .part name until it has been verified
+        part_path = save_path + ".part"
+        # Folder bundles are extracted while they stream in
+        handle = BundleExtractor(part_path) if pending.get(
+            "bundle") else open(part_path, 'wb')
+        self.incoming_transfers[file_id] = {
+            "path": save_path, "part_path": part_path, "size": filesize,
+            "received": 0, "digests": {}, "retries": 0,
+            "bundle": bool(pending.get("bundle")),
+            "original_filename": filename, "handle": handle,
+            "transfer": transfer}
+
+    def _write_incoming_chunk(self, file_id, offset, digest, payload):
+        info = self.incoming_transfers.get(file_id)
+        if not info:
+            # Chunks still in flight after a cancel are expected
+            return
+        self.transfer_manager.throttle("down", len(payload))
+        transfer = info["transfer"]
+        started = time.perf_counter()
+        valid = chunk_digest(payload) == digest
+        transfer.verify_seconds += time.perf_counter() - started
+        if not valid or (info["bundle"] and offset != info["received"]):
+            if info["bundle"]:
+                # Bundles are extracted in order and cannot be patched later
+                self._fail_incoming_file(
+                    file_id, f"corrupt chunk at offset {offset}")
+            else:
+                print(
+                    f"Chunk at offset {offset} of {info['original_filename']} failed verification")
+            return
+        if not info["bundle"]:
+            info["handle"].seek(offset)
+        info["handle"].write(payload)
+        if offset not in info["digests"]:
+            info["received"] += len(payload)
+            transfer.advance(len(payload))
+        info["digests"][offset] = digest
+
+    def _verify_incoming_file(self, file_id, file_digest):
+        """Check every chunk arrived intact; re-request only the ones that did not."""
+        info = self.incoming_transfers.get(file_id)
+        if not info:
+            return
+        offsets = range(0, info["size"], CHUNK_SIZE)
+        missing = [offset for offset in offsets if offset not in info["digests"]]
+        if missing:
+            info["retries"] += 1
+            if info["bundle"] or info["retries"] > MAX_CHUNK_RETRIES:
+                self._fail_incoming_file(
+                    file_id, f"{len(missing)} chunks missing or corrupt")
+                return
+            self.send_command(
+                f"FILE_RESEND:{file_id}:{','.join(map(str, missing))}")
+            return
+        started = time.perf_counter()
+        valid = tree_digest(
+            *(info["digests"][offset] for offset in offsets)) == file_digest
+        info["transfer"].verify_seconds += time.perf_counter() - started
+        if not valid:
+            self._fail_incoming_file(file_id, "file hash mismatch")
+            return
+        self._finish_incoming_file(file_id)
+
+    def _finish_incoming_file(self, file_id):
+        info = self.incoming_transfers[file_id]
+        info["handle"].close()
+        if getattr(info["handle"], "error", None):
+            self._fail_incoming_file(file_id, "bundle extraction failed")
+            return
+        del self.incoming_transfers[file_id]
+        self.pending_transfers.pop(file_id, None)
+        os.replace(info["part_path"], info["path"])
+        self.send_command(f"FILE_VERIFIED:{file_id}")
+        self.transfer_manager.finish(file_id)
+        transfer = info["transfer"]
+        print(f"Verified {info['original_filename']}: {len(info['digests'])} chunks, "
+              f"{transfer.verify_seconds * 1000:.1f} ms hashing")
+        self.update_status(
+            f"Successfully received {info['original_filename']}", "green")
+        self.after(10, self.add_file_to_gallery,
+                   file_id, info['original_filename'], info['path'])
+
+    def _fail_incoming_file(self, file_id, reason):
+        info = self.incoming_transfers.get(file_id)
+        if not info:
+            return
+        print(f"Integrity check failed for {info['original_filename']}: {reason}")
+        self.send_command(f"FILE_CANCEL:{file_id}")
+        self._abort_incoming_file(file_id)
+        self.pending_transfers.pop(file_id, None)
+        self.transfer_manager.finish(file_id, "failed")
+        self.update_status(
+            f"Failed to receive {info['original_filename']}: {reason}", "red")
+
+    def _abort_incoming_file(self, file_id):
+        """Close and remove a partially received file."""
+        info = self.incoming_transfers.pop(file_id, None)
+        if not info:
+            return
+        try:
+            info["handle"].close()
+            if os.path.isdir(info["part_path"]):
+                shutil.rmtree(info["part_path"])
+            elif os.path.exists(info["part_path"]):
+                os.remove(info["part_path"])
+        except OSError as e:
+            print(f"Error removing partial file: {e}")
+
+    def _abort_incoming_transfers(self):
+        for file_id in list(self.incoming_transfers):
+            self._abort_incoming_file(file_id)
+
+    def _consume_buffer(self, buffer):
+        """Dispatch every complete command and binary frame held in buffer."""
+        while True:
+            sep = buffer.find(b"\n")
+            if sep < 0:
+                return
+            command_str = bytes(buffer[:sep]).decode('utf-8', errors='ignore')
+            cmd = command_str.split(":", 1)[0]
+            if cmd in BINARY_FRAMES:
+                length = int(command_str.rsplit(":", 1)[1])
+                end = sep + 1 + length
+                if len(buffer) < end:
+                    return
+                payload = bytes(buffer[sep + 1:end])
+                del buffer[:end]
+                self.process_frame(command_str, payload)
+                continue
+            del buffer[:sep + 1]
+            if command_str:
+                self.process_command(command_str)
+
+    def receive_data(self, sock=None, bulk=False):
+        sock = sock or self.connection
+        buffer = bytearray()
+        while bulk or self.connected.is_set():
+            try:
+                chunk = sock.recv(CHUNK_SIZE)
+                if not chunk:
+                    self._connection_lost(sock)
+                    break
                 buffer += chunk
-                while separator in buffer:
-                    line_bytes, buffer = buffer.split(separator, 1)
-                    command_str = line_bytes.decode('utf-8', errors='ignore')
-
-                    if command_str.startswith("FILE_START_TRANSFER"):
-                        _, file_id, filename_from_cmd, filesize_str = command_str.split(
-                            ":", 3)
-
-                        save_filename = filename_from_cmd
-                        if file_id in self.pending_transfers and 'filename' in self.pending_transfers[file_id]:
-                            save_filename = self.pending_transfers[file_id]['filename']
-
-                        save_path = os.path.join(
-                            self.downloads_folder, f"{file_id}_{save_filename}")
-
-                        if save_path:
-                            receiving_file_info = {"id": file_id, "path": save_path, "size": int(
-                                filesize_str), "original_filename": save_filename}
-
-                            if len(buffer) >= int(filesize_str):
-                                file_data, buffer = buffer[:int(
-                                    filesize_str)], buffer[int(filesize_str):]
-                                with open(save_path, 'wb') as f:
-                                    f.write(file_data)
-                                self.update_status(
-                                    f"Successfully received {save_filename}", "green")
-                                self.after(10, self.add_file_to_gallery,
-                                           file_id, save_filename, save_path)
-                                receiving_file_info = None
-                        continue
-                    elif command_str:
-                        self.process_command(command_str)
+                self._consume_buffer(buffer)
             except Exception as e:
                 print(f"Receive loop error: {e}")
-                self.update_status(f"Connection error: {e}", "red")
-                self.handle_disconnect()
+                if not bulk:
+                    self.update_status(f"Connection error: {e}", "red")
+                self._connection_lost(sock)
                 break
 
-    def send_command(self, data_str):
-        # Send data if socket exists
-        if self.connection:
-            try:
-                self.connection.sendall((data_str + "\n").encode('utf-8'))
-            except Exception as e:
-                print(f"Error sending command: {e}")
-                self.handle_disconnect()
-        else:
-            print("Not connected, cannot send command.")
+    def _connection_lost(self, sock):
+        """Tear down whichever current connection sock belongs to."""
+        if sock is self.bulk_connection:
+            self._drop_bulk_connection()
+        elif sock is self.connection:
+            self.handle_disconnect()
+
+    def send_command(self, data_str, scheduler=None):
+        cmd = data_str.split(":", 1)[0]
+        if cmd in OUTBOX_COMMANDS:
+            # Checked under the lock so nothing slips in behind a reconnect's flush
+            with self.outbox_lock:
+                if not (self.connection and self.scheduler):
+                    self.outbox.add(data_str)
+                    return True
+        # Queue data on the writer if socket exists
+        if self.connection and self.scheduler:
+            key = cmd if cmd in COALESCED_COMMANDS else None
+            return self._queue_bytes((data_str + "\n").encode('utf-8'),
+                                     COMMAND_PRIORITIES.get(cmd, PRIORITY_CONTROL),
+                                     key, scheduler=scheduler)
+        print("Not connected, cannot send command.")
+        return False
+
+    def send_frame_json(self, cmd, obj, priority=PRIORITY_BULK):
+        # Vault nodes and manifests can run to megabytes, so like the chunks
+        # they follow they go on the bulk socket, behind interactive traffic
+        payload = json.dumps(obj).encode('utf-8')
+        return self.send_frame(f"{cmd}:{len(payload)}", payload, priority)
+
+    def send_frame(self, header, payload, priority=PRIORITY_BULK, on_sent=None,
+                   scheduler=None):
+        """Send a header line and its binary payload as one unit."""
+        return self._queue_bytes((header + "\n").encode('utf-8') + payload,
+                                 priority, on_sent=on_sent, scheduler=scheduler)
+
+    def _bulk_route(self):
+        """The scheduler bulk data takes right now.
+
+        A stream of frames that must arrive in order (a file's start, chunks
+        and end) pins this once and passes it to every send, so a bulk
+        connection coming up half way cannot split the stream across sockets.
+        """
+        return self.bulk_scheduler or self.scheduler
+
+    def _queue_bytes(self, data, priority, key=None, on_sent=None, scheduler=None):
+        if not scheduler:
+            scheduler = self.scheduler
+            if priority == PRIORITY_BULK and self.bulk_scheduler:
+                scheduler = self.bulk_scheduler
+        if not scheduler:
+            return False
+        return scheduler.send(data, priority, key, on_sent)
 
     def send_file(self, local_path):
         """Initiate a file transfer by sending a request to the peer."""
         if not os.path.exists(local_path):
             self.update_status(f"File not found: {local_path}", "red")
             return
+        if not self.connection:
+            # FILE_REQUEST is not queued offline, so the row would never leave "Queued"
+            self.update_status("Connect to a peer before sending files", "orange")
+            return
         file_id = str(uuid.uuid4())
         filename = os.path.basename(local_path)
         filesize = os.path.getsize(local_path)
         self.pending_transfers[file_id] = {
             "filename": filename, "filepath": local_path, "filesize": filesize}
+        self.transfer_manager.add(Transfer(file_id, filename, filesize, "up"))
+        # A small preview goes ahead of the request so the peer can show
+        # the tile before any bulk data arrives
+        preview = make_preview(local_path)
+        if preview:
+            data, (width, height) = preview
+            with open(os.path.join(self.thumbnails_folder, f"{file_id}.jpg"), 'wb') as f:
+                f.write(data)
+            self.send_frame(f"FILE_PREVIEW:{file_id}:{width}:{height}:{len(data)}",
+                            data, PRIORITY_CONTROL)
         # Request peer to accept the file transfer
         self.send_command(f"FILE_REQUEST:{file_id}:{filename}:{filesize}")
         self.update_status(f"Initiated file transfer: {filename}", "white")
         # Add locally to gallery for sender view
         self.add_file_to_gallery(file_id, filename, local_path)
 
+    def send_folder(self, dir_path):
+        """Offer a whole folder to the peer as one streamed tar bundle."""
+        dir_path = os.path.normpath(dir_path)
+        if not self.connection:
+            self.update_status("Connect to a peer before sending files", "orange")
+            return
+        file_id = str(uuid.uuid4())
+        dirname = os.path.basename(dir_path)
+        self._offer_folder(file_id, dirname, dir_path)
+        self.add_file_to_gallery(file_id, dirname, dir_path)
+
+    def _offer_folder(self, file_id, dirname, dir_path):
+        """List the folder on a worker thread, then send BUNDLE_REQUEST."""
+        # Shown as queued while thousands of files are being listed
+        self.transfer_manager.add(Transfer(file_id, dirname, 0, "up"))
+        threading.Thread(target=self._build_folder_offer, args=(
+            file_id, dirname, dir_path), daemon=True).start()
+
+    def _build_folder_offer(self, file_id, dirname, dir_path):
+        try:
+            entries = build_bundle(dir_path)
+        except OSError as e:
+            print(f"Error listing folder {dir_path}: {e}")
+            self.transfer_manager.finish(file_id, "failed")
+            return
+        transfer = self.transfer_manager.get(file_id)
+        if not transfer or transfer.finished:
+            return  # cancelled while listing
+        if not self.connection:
+            self.transfer_manager.finish(file_id, "failed")
+            return
+        filesize = bundle_size(entries)
+        count = sum(1 for _, path, _ in entries if path)
+        transfer.total = filesize
+        self.pending_transfers[file_id] = {
+            "filename": dirname, "filepath": dir_path, "filesize": filesize,
+            "bundle": entries}
+        self.send_command(
+            f"BUNDLE_REQUEST:{file_id}:{dirname}:{filesize}:{count}")
+        self.update_status(
+            f"Initiated folder transfer: {dirname} ({count} files)", "white")
+
+    def _read_source(self, transfer):
+        """Yield the bytes of a pending transfer in CHUNK_SIZE pieces."""
+        if transfer.get("bundle"):
+            yield from iter_bundle(transfer["bundle"])
+            return
+        with open(transfer["filepath"], 'rb') as f:
+            remaining = transfer["filesize"]
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def _start_upload(self, file_id):
+        """Queue the data send until an upload slot is free."""
+        self.transfer_manager.start(file_id, lambda: threading.Thread(
+            target=self._send_file_data, args=(file_id,), daemon=True).start())
+
     def _send_file_data(self, file_id):
         """Send the actual file data after peer accepts the transfer."""
         transfer = self.pending_transfers.get(file_id)
-        if not transfer:
+        progress = self.transfer_manager.get(file_id)
+        if not transfer or not progress:
             print(f"No pending transfer for file_id: {file_id}")
+            self.transfer_manager.finish(file_id, "failed")
             return
-        filepath = transfer.get("filepath")
         filesize = transfer.get("filesize")
         filename = transfer.get("filename")
-        # Notify peer to start transfer
-        self.send_command(
-            f"FILE_START_TRANSFER:{file_id}:{filename}:{filesize}")
+        route = self._bulk_route()
         try:
-            with open(filepath, 'rb') as f:
-                while True:
-                    chunk = f.read(8192)
-                    if not chunk:
-                        break
-                    self.connection.sendall(chunk)
-            self.update_status(f"File sent: {filename}", "green")
+            # Notify peer to start transfer
+            if not self.send_command(
+                    f"FILE_START_TRANSFER:{file_id}:{filename}:{filesize}", route):
+                raise ConnectionError("connection closed")
+            # Chunks are framed so the writer can interleave other traffic,
+            # and hashed on the way out so the peer can verify them
+            digests, offset = [], 0
+            for chunk in self._read_source(transfer):
+                progress.wait_if_paused()
+                if progress.finished:
+                    break
+                self.transfer_manager.throttle("up", len(chunk))
+                started = time.perf_counter()
+                digest = chunk_digest(chunk)
+                progress.verify_seconds += time.perf_counter() - started
+                if not self.send_frame(f"FILE_CHUNK:{file_id}:{offset}:{digest}:{len(chunk)}",
+                                       chunk, scheduler=route):
+                    raise ConnectionError("connection closed")
+                digests.append(digest)
+                offset += len(chunk)
+                progress.advance(len(chunk))
+            if not progress.finished:
+                # Kept until the peer answers FILE_VERIFIED or FILE_RESEND
+                transfer["digest"] = tree_digest(*digests)
+                if not self.send_command(
+                        f"FILE_END:{file_id}:{transfer['digest']}", route):
+                    raise ConnectionError("connection closed")
+                self.update_status(f"File sent: {filename}", "green")
+                return
         except Exception as e:
             print(f"Error sending file data: {e}")
             self.update_status(f"Failed to send file: {filename}", "red")
+            progress.state = "failed"
+            # Lets the peer release its partial file and download slot
+            self.send_command(f"FILE_CANCEL:{file_id}")
+        self.transfer_manager.finish(file_id, progress.state)
         # Clean up pending transfer
         if file_id in self.pending_transfers:
             del self.pending_transfers[file_id]
 
+    def _resend_chunks(self, file_id, offsets):
+        """Re-read and resend only the chunks the peer could not verify."""
+        transfer = self.pending_transfers.get(file_id)
+        if not transfer or "digest" not in transfer or transfer.get("bundle"):
+            print(f"Cannot resend chunks for file_id: {file_id}")
+            return
+        route = self._bulk_route()
+        try:
+            with open(transfer["filepath"], 'rb') as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    chunk = f.read(
+                        min(CHUNK_SIZE, transfer["filesize"] - offset))
+                    self.transfer_manager.throttle("up", len(chunk))
+                    if not self.send_frame(f"FILE_CHUNK:{file_id}:{offset}:{chunk_digest(chunk)}:{len(chunk)}",
+                                           chunk, scheduler=route):
+                        return
+            self.send_command(f"FILE_END:{file_id}:{transfer['digest']}", route)
+        except OSError as e:
+            print(f"Error resending chunks: {e}")
+
     def _identity_selected(self, identity):
         self.my_name = identity
         self.update_status(f"Identity set to: {identity}", "white")
@@ -761,8 +3187,7 @@ class VortexTunnelApp(ctk.CTkFrame):
             # Create and connect socket
             client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             client.connect((peer_ip, self.port))
-            self.connection = client
-            self.connected.set()
+            self._attach_connection(client)
             self.peer_name = peer
             # Start receiving loop
             threading.Thread(target=self.receive_data, daemon=True).start()
@@ -771,6 +3196,58 @@ class VortexTunnelApp(ctk.CTkFrame):
         except Exception as e:
             # Connection failed
             print(f"Connection failed to {peer_ip}: {e}")
+            return
+        try:
+            bulk_client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            tune_socket(bulk_client, bulk=True)
+            bulk_client.settimeout(5)
+            bulk_client.connect((peer_ip, self.bulk_port))
+            bulk_client.settimeout(None)
+            self._attach_bulk_connection(bulk_client)
+        except Exception as e:
+            # Bulk data falls back to the interactive connection
+            print(f"Bulk connection failed to {peer_ip}: {e}")
+
+    def _attach_connection(self, sock):
+        """Adopt sock as the interactive connection and start its writer."""
+        tune_socket(sock)
+        if self.scheduler:
+            self.scheduler.close()
+        self.scheduler = SendScheduler(
+            sock, lambda: self._connection_lost(sock))
+        with self.outbox_lock:
+            # The offline backlog goes out first, as one compressed frame
+            payload = self.outbox.batch()
+            if payload:
+                self.send_frame(f"OUTBOX_BATCH:{len(payload)}",
+                                payload, PRIORITY_CHAT)
+            self.connection = sock
+        self.connected.set()
+        if self.screen_sharer:
+            # A new viewer needs every tile, not just the changed ones
+            self.screen_sharer.encoder.reset()
+        threading.Thread(target=self._announce_vault, daemon=True).start()
+
+    def _attach_bulk_connection(self, sock):
+        """Adopt sock as the bulk connection, start its writer and reader."""
+        self._drop_bulk_connection()
+        tune_socket(sock, bulk=True)
+        self.bulk_connection = sock
+        self.bulk_scheduler = SendScheduler(
+            sock, lambda: self._connection_lost(sock))
+        threading.Thread(target=self.receive_data, args=(sock, True),
+                         daemon=True).start()
+
+    def _drop_bulk_connection(self):
+        if self.bulk_scheduler:
+            self.bulk_scheduler.close()
+            self.bulk_scheduler = None
+        if self.bulk_connection:
+            try:
+                self.bulk_connection.close()
+            except OSError:
+                pass
+            self.bulk_connection = None
 
     def start_server(self):
         """Start the TCP server to listen for incoming connections."""
@@ -779,8 +3256,7 @@ class VortexTunnelApp(ctk.CTkFrame):
                 try:
                     client_socket, addr = self.server.accept()
                     print(f"Accepted connection from {addr}")
-                    self.connection = client_socket
-                    self.connected.set()
+                    self._attach_connection(client_socket)
                     self.update_status(f"Connected to {addr}", "green")
                     # Start receiving data from the client
                     self.receive_data()
@@ -788,6 +3264,16 @@ class VortexTunnelApp(ctk.CTkFrame):
                     print(f"Error in accept loop: {e}")
                     break
 
+        def bulk_accept_loop():
+            while True:
+                try:
+                    client_socket, addr = self.bulk_server.accept()
+                    print(f"Accepted bulk connection from {addr}")
+                    self._attach_bulk_connection(client_socket)
+                except Exception as e:
+                    print(f"Error in bulk accept loop: {e}")
+                    break
+
         def run_server():
             self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -799,20 +3285,42 @@ class VortexTunnelApp(ctk.CTkFrame):
                 f"Listening for connections on {self.host_ip_listen}:{self.port}", "white")
             accept_loop()
 
+        def run_bulk_server():
+            self.bulk_server = socket.socket(
+                socket.AF_INET, socket.SOCK_STREAM)
+            self.bulk_server.setsockopt(
+                socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            # Set before listen so accepted sockets inherit the large window
+            tune_socket(self.bulk_server, bulk=True)
+            self.bulk_server.bind((self.host_ip_listen, self.bulk_port))
+            self.bulk_server.listen(5)
+            bulk_accept_loop()
+
         threading.Thread(target=run_server, daemon=True).start()
+        threading.Thread(target=run_bulk_server, daemon=True).start()
 
     def handle_disconnect(self):
         """Handle cleanup and UI updates on disconnect."""
         self.connected.clear()
+        if self.scheduler:
+            self.scheduler.close()
+            self.scheduler = None
+        self._drop_bulk_connection()
         if self.connection:
             self.connection.close()
             self.connection = None
+        self._abort_incoming_transfers()
         self.update_status("Disconnected", "red")
         # Clear remote mouse and other states
         self.clear_remote_mouse()
         self.canvas.delete("all")
+        self.stop_screen_share(notify_peer=False)
+        self.clear_remote_screen()
         # Reset file transfers
         self.pending_transfers.clear()
+        self.transfer_manager.fail_all()
+        for token in list(self.vault_downloads):
+            self._abort_vault_download(token)
         # Refresh gallery
         self._apply_filter_search()
 
@@ -895,11 +3403,31 @@ class VortexTunnelApp(ctk.CTkFrame):
         default_name = data['filename']
         # Ask where to save
         save_path = filedialog.asksaveasfilename(initialfile=default_name)
-        if save_path:
-            try:
-                shutil.copy(src_path, save_path)
-            except Exception as e:
-                print(f"Error saving file: {e}")
+        if not save_path:
+            return
+        try:
+            total = path_size(src_path)
+        except OSError as e:
+            print(f"Error saving file: {e}")
+            return
+        transfer = self.transfer_manager.add(Transfer(
+            str(uuid.uuid4()), os.path.basename(save_path), total, "export"))
+        transfer.state = "active"
+        threading.Thread(target=self._export_worker, args=(
+            src_path, save_path, transfer), daemon=True).start()
+
+    def _export_worker(self, src_path, save_path, transfer):
+        """Copy a gallery item out in the background, reporting progress in the transfers panel."""
+        created = not os.path.exists(save_path)
+        try:
+            export_path(src_path, save_path, transfer)
+            self.transfer_manager.finish(transfer.file_id)
+        except ExportCancelled:
+            if created and os.path.isdir(save_path):
+                shutil.rmtree(save_path, ignore_errors=True)
+        except Exception as e:
+            print(f"Error saving file: {e}")
+            self.transfer_manager.finish(transfer.file_id, "failed")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,265 @@
+import io
+import struct
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+# Kept free of Tk imports so the pipeline can be benchmarked headless:
+#   python screen_share.py --frames 300 --bandwidth 2000
+
+TILE_SIZE = 64
+MAX_SIZE = (1920, 1080)
+FORMAT_JPEG, FORMAT_PNG = 0, 1
+FRAME_HEADER = struct.Struct("<HHH")  # width, height, tile count
+TILE_HEADER = struct.Struct("<HHHHBI")  # x, y, w, h, format, length
+
+
+def find_dirty_tiles(previous, frame, tile=TILE_SIZE):
+    """Return (x, y) origins of tiles that differ between two RGB frames."""
+    height, width, channels = frame.shape
+    if previous is None or previous.shape != frame.shape:
+        return [(x, y) for y in range(0, height, tile) for x in range(0, width, tile)]
+    # OR-reduce byte differences over tile-wide column bands, then tile-high
+    # row bands; reduceat copes with partial tiles at the edges
+    changed = (previous != frame).reshape(height, width * channels)
+    bands = np.logical_or.reduceat(
+        changed, np.arange(0, width * channels, tile * channels), axis=1)
+    dirty = np.logical_or.reduceat(bands, np.arange(0, height, tile), axis=0)
+    return [(c * tile, r * tile) for r, c in zip(*np.nonzero(dirty))]
+
+
+def encode_tile(tile, quality):
+    """PNG for flat UI content (few colours), JPEG for photographic content."""
+    image = Image.fromarray(tile)
+    buf = io.BytesIO()
+    if image.getcolors(maxcolors=256) is not None:
+        image.save(buf, format="PNG", optimize=False)
+        return FORMAT_PNG, buf.getvalue()
+    image.save(buf, format="JPEG", quality=quality)
+    return FORMAT_JPEG, buf.getvalue()
+
+
+class FrameEncoder:
+    """Encodes only the tiles that changed since the last encoded frame."""
+
+    def __init__(self, tile=TILE_SIZE):
+        self.tile = tile
+        self.reference = None
+
+    def reset(self):
+        self.reference = None
+
+    def encode(self, frame, quality):
+        """Return (payload, dirty tile count), or (None, 0) if nothing changed."""
+        height, width = frame.shape[:2]
+        dirty = find_dirty_tiles(self.reference, frame, self.tile)
+        self.reference = frame
+        if not dirty:
+            return None, 0
+        parts = [FRAME_HEADER.pack(width, height, len(dirty))]
+        for x, y in dirty:
+            tile = frame[y:y + self.tile, x:x + self.tile]
+            fmt, data = encode_tile(tile, quality)
+            parts.append(TILE_HEADER.pack(
+                x, y, tile.shape[1], tile.shape[0], fmt, len(data)))
+            parts.append(data)
+        return b"".join(parts), len(dirty)
+
+
+class FrameDecoder:
+    """Pastes received tiles onto the last known remote frame."""
+
+    def __init__(self):
+        self.image = None
+
+    def decode(self, payload):
+        width, height, count = FRAME_HEADER.unpack_from(payload, 0)
+        if self.image is None or self.image.size != (width, height):
+            self.image = Image.new("RGB", (width, height))
+        offset = FRAME_HEADER.size
+        for _ in range(count):
+            x, y, _, _, _, length = TILE_HEADER.unpack_from(payload, offset)
+            offset += TILE_HEADER.size
+            tile = Image.open(io.BytesIO(payload[offset:offset + length]))
+            self.image.paste(tile.convert("RGB"), (x, y))
+            offset += length
+        return self.image
+
+
+class AdaptiveRate:
+    """Trades JPEG quality and frame rate against measured bandwidth."""
+
+    def __init__(self, fps=15, min_fps=2, max_fps=30, quality=75,
+                 min_quality=30, max_quality=85):
+        self.fps, self.min_fps, self.max_fps = fps, min_fps, max_fps
+        self.quality, self.min_quality, self.max_quality = quality, min_quality, max_quality
+        self.bandwidth = 0.0  # bytes per second, smoothed
+
+    def record(self, size, send_seconds):
+        """Feed back how long the last frame took to leave the send queue."""
+        if send_seconds > 0:
+            sample = size / send_seconds
+            self.bandwidth = sample if not self.bandwidth else 0.8 * \
+                self.bandwidth + 0.2 * sample
+        budget = 1 / self.fps
+        if send_seconds > budget:
+            # Quality goes first; frame rate only once quality bottoms out
+            if self.quality > self.min_quality:
+                self.quality = max(self.min_quality, self.quality - 10)
+            else:
+                self.fps = max(self.min_fps, self.fps - 2)
+        elif send_seconds < budget / 2:
+            if self.fps < self.max_fps:
+                self.fps = min(self.max_fps, self.fps + 1)
+            else:
+                self.quality = min(self.max_quality, self.quality + 5)
+
+
+class SyntheticFrameSource:
+    """Deterministic moving content for headless benchmarks."""
+
+    def __init__(self, width=1920, height=1080):
+        self.width, self.height = width, height
+        y, x = np.mgrid[0:height, 0:width]
+        self.background = np.stack(
+            [(x * 255 // width), (y * 255 // height),
+             np.full_like(x, 96)], axis=2).astype(np.uint8)
+        self.rng = np.random.default_rng(0)
+        self.count = 0
+
+    def grab(self):
+        frame = self.background.copy()
+        w, h = self.width, self.height
+        t = self.count
+        self.count += 1
+        # A window sliding across the screen
+        win_w, win_h = w // 5, h // 4
+        x0 = (t * 16) % max(1, w - win_w)
+        frame[h // 5:h // 5 + win_h, x0:x0 + win_w] = (230, 230, 230)
+        frame[h // 5:h // 5 + win_h // 10, x0:x0 + win_w] = (40, 90, 200)
+        # A small "video" region full of noise
+        video = frame[h // 2:h // 2 + h // 7, w // 20:w // 20 + w // 7]
+        video[:] = self.rng.integers(0, 256, video.shape, dtype=np.uint8)
+        # A blinking cursor
+        if t % 2:
+            frame[h * 5 // 6:h * 5 // 6 + 20, w // 2:w // 2 + 2] = 0
+        return frame
+
+
+class ScreenGrabSource:
+    """Captures the primary display, scaled down to at most 1080p."""
+
+    def grab(self):
+        from PIL import ImageGrab
+        image = ImageGrab.grab()
+        if image.width > MAX_SIZE[0] or image.height > MAX_SIZE[1]:
+            image.thumbnail(MAX_SIZE)
+        return np.asarray(image.convert("RGB"))
+
+
+class ScreenSharer:
+    """Capture, diff, encode and send loop with latest-frame-wins semantics.
+
+    A frame is only captured once the previous one has left the send queue,
+    so frames never pile up and the receiver always gets the newest screen.
+    send(payload) queues a frame; wait_sent(timeout) blocks until it has
+    drained from the socket and returns False on timeout. The time that
+    takes is what drives AdaptiveRate.
+    """
+
+    def __init__(self, source, send, wait_sent, on_stats=None):
+        self.source = source
+        self.send = send
+        self.wait_sent = wait_sent
+        self.on_stats = on_stats
+        self.encoder = FrameEncoder()
+        self.rate = AdaptiveRate()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self.encoder.reset()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                frame = self.source.grab()
+                payload, dirty = self.encoder.encode(frame, self.rate.quality)
+                if payload is not None:
+                    if not self.send(payload):
+                        return
+                    queued = time.monotonic()
+                    while not self.wait_sent(0.5):
+                        if self._stop.is_set():
+                            return
+                    self.rate.record(len(payload), time.monotonic() - queued)
+                if self.on_stats:
+                    self.on_stats(self.rate, dirty, len(payload or b""))
+            except Exception as e:
+                print(f"Screen share error: {e}")
+                return
+            self._stop.wait(max(0, 1 / self.rate.fps -
+                                (time.monotonic() - started)))
+
+
+def benchmark(frames=120, width=1920, height=1080, bandwidth_kb=0):
+    """Run the pipeline on synthetic frames and print per-stage timings."""
+    source = SyntheticFrameSource(width, height)
+    encoder, decoder, rate = FrameEncoder(), FrameDecoder(), AdaptiveRate()
+    grab_t = diff_t = encode_t = decode_t = 0.0
+    total_bytes = total_dirty = 0
+    tiles = -(-width // TILE_SIZE) * -(-height // TILE_SIZE)
+    for _ in range(frames):
+        t0 = time.perf_counter()
+        frame = source.grab()
+        t1 = time.perf_counter()
+        find_dirty_tiles(encoder.reference, frame)
+        t2 = time.perf_counter()
+        payload, dirty = encoder.encode(frame, rate.quality)
+        t3 = time.perf_counter()
+        if payload:
+            decoder.decode(payload)
+            total_bytes += len(payload)
+            if bandwidth_kb:
+                rate.record(len(payload), len(payload) / (bandwidth_kb * 1024))
+        t4 = time.perf_counter()
+        grab_t, diff_t = grab_t + t1 - t0, diff_t + t2 - t1
+        encode_t, decode_t = encode_t + t3 - t2, decode_t + t4 - t3
+        total_dirty += dirty
+    print(f"{frames} frames at {width}x{height}, {tiles} tiles per frame")
+    print(f"  grab    {grab_t / frames * 1000:7.2f} ms/frame")
+    print(f"  diff    {diff_t / frames * 1000:7.2f} ms/frame")
+    print(f"  encode  {encode_t / frames * 1000:7.2f} ms/frame (includes diff)")
+    print(f"  decode  {decode_t / frames * 1000:7.2f} ms/frame")
+    print(f"  dirty   {total_dirty / frames / tiles:7.1%} of tiles")
+    print(f"  size    {total_bytes / frames / 1024:7.1f} KB/frame")
+    print(f"  pipeline ceiling {frames / (encode_t + decode_t):.1f} fps")
+    if bandwidth_kb:
+        print(f"  adapted to {rate.fps} fps at JPEG quality {rate.quality} "
+              f"for {bandwidth_kb} KB/s")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Benchmark the screen-sharing pipeline on synthetic frames.")
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--bandwidth", type=int, default=0,
+                        help="simulated link speed in KB/s for rate adaptation")
+    args = parser.parse_args()
+    benchmark(args.frames, args.width, args.height, args.bandwidth)